@@ -0,0 +1,121 @@
+import copy
+import re
+from base64 import urlsafe_b64encode
+from hashlib import sha256
+from typing import BinaryIO, Iterator
+from uuid import uuid4
+from coordinator import document_lock
+from store import read_json, write_json
+from utils import STORAGE_DIR, encrypt_bytes, decrypt_bytes
+
+BLOBS_DIR = STORAGE_DIR / "blobs"
+BLOB_INDEX = BLOBS_DIR / "index.json"
+
+# Blobs are encrypted in independent chunks so a range can be served
+# by decrypting only the chunks it overlaps
+CHUNK_SIZE = 64 * 1024
+
+_BLOB_ID = re.compile(r"[0-9a-f]{64}")
+
+
+def _token_length(plaintext_length: int) -> int:
+    # Fernet: version (1) + timestamp (8) + IV (16) + padded ciphertext + HMAC (32), base64 encoded
+    raw_length = 1 + 8 + 16 + (plaintext_length // 16 + 1) * 16 + 32
+    return len(urlsafe_b64encode(bytes(raw_length)))
+
+
+def is_blob_id(blob_id: str) -> bool:
+    return _BLOB_ID.fullmatch(blob_id) is not None
+
+
+def blob_path(blob_id: str):
+    return BLOBS_DIR / blob_id[:2] / f"{blob_id}.blob"
+
+
+def load_index() -> dict:
+    if not BLOB_INDEX.exists():
+        return {}
+    return read_json(BLOB_INDEX)
+
+
+def store_blob(file: BinaryIO, content_type: str) -> dict:
+    """
+    Encrypts `file` into the store chunk by chunk, named by the SHA-256 of its
+    contents. Content that is already stored is not written a second time.
+    Takes one reference to the blob for the caller and returns its metadata.
+    """
+    BLOBS_DIR.mkdir(exist_ok=True)
+    temp_path = BLOBS_DIR / f"{uuid4().hex}.tmp"
+    digest = sha256()
+    size = 0
+    try:
+        with open(temp_path, "wb") as blob:
+            while chunk := file.read(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+                blob.write(encrypt_bytes(chunk) + b"\n")
+        blob_id = digest.hexdigest()
+        path = blob_path(blob_id)
+        with document_lock(BLOB_INDEX):
+            index = copy.deepcopy(load_index())
+            if "size" not in index.get(blob_id, {}):
+                path.parent.mkdir(exist_ok=True)
+                temp_path.replace(path)
+                refs = index.get(blob_id, {}).get("refs", 0)
+                index[blob_id] = {"size": size, "content_type": content_type, "refs": refs}
+            # Taken with the blob still locked, so a concurrent release cannot delete it first
+            index[blob_id]["refs"] += 1
+            write_json(BLOB_INDEX, index)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return {"id": blob_id, "size": size, "content_type": index[blob_id]["content_type"]}
+
+
+def add_refs(blob_ids: list[str]):
+    if not blob_ids:
+        return
+    with document_lock(BLOB_INDEX):
+        index = copy.deepcopy(load_index())
+        for blob_id in blob_ids:
+            # Cards synced from another install can reference content not stored here
+            # yet; the entry only counts references until the content is stored
+            index.setdefault(blob_id, {"refs": 0})["refs"] += 1
+        write_json(BLOB_INDEX, index)
+
+
+def release(blob_ids: list[str]) -> int:
+    """
+    Drops one reference to each blob and deletes the blobs no longer
+    referenced by any card. Returns how many blobs were deleted.
+    """
+    if not blob_ids:
+        return 0
+    deleted = 0
+    with document_lock(BLOB_INDEX):
+        index = copy.deepcopy(load_index())
+        for blob_id in blob_ids:
+            if blob_id not in index:
+                continue
+            index[blob_id]["refs"] -= 1
+            if index[blob_id]["refs"] <= 0:
+                index.pop(blob_id)
+                blob_path(blob_id).unlink(missing_ok=True)
+                deleted += 1
+        write_json(BLOB_INDEX, index)
+    return deleted
+
+
+def read_range(blob_id: str, start: int, end: int) -> Iterator[bytes]:
+    """
+    Yields the plaintext bytes `start` to `end` (inclusive) of a blob,
+    decrypting one chunk at a time.
+    """
+    first_chunk = start // CHUNK_SIZE
+    last_chunk = end // CHUNK_SIZE
+    with open(blob_path(blob_id), "rb") as blob:
+        # Every chunk but the last has the same encrypted length
+        blob.seek(first_chunk * (_token_length(CHUNK_SIZE) + 1))
+        for chunk_number in range(first_chunk, last_chunk + 1):
+            chunk = decrypt_bytes(blob.readline().rstrip(b"\n"))
+            chunk_start = chunk_number * CHUNK_SIZE
+            yield chunk[max(start - chunk_start, 0):end - chunk_start + 1]
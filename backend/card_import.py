@@ -0,0 +1,68 @@
+import csv
+import html
+import re
+from hashlib import sha256
+from itertools import chain
+from pathlib import Path
+from typing import Iterator
+
+# Separators named in Anki's "#separator:" header
+ANKI_SEPARATORS = {"tab": "\t", "comma": ",", "semicolon": ";", "pipe": "|", "space": " ", "colon": ":"}
+
+
+def content_hash(question: str, answer: str) -> str:
+    """
+    Hashes a card's question and answer ignoring case and whitespace
+    differences, so reformatted copies of a card count as duplicates.
+    """
+    normalized = [" ".join(text.split()).casefold() for text in (question, answer)]
+    return sha256("\x1f".join(normalized).encode()).hexdigest()
+
+
+def read_rows(path: Path, file_format: str, filename: str = "") -> Iterator[tuple[int, list[str], list[str]]]:
+    """
+    Yields (line number, [question, answer], tags) for every card row of a
+    CSV, TSV or Anki text export, reading the file line by line. Anki
+    "#key:value" header lines pick the separator, tags column and HTML
+    handling; a "question,answer" header row is skipped. Raises ValueError
+    for header values that cannot be used.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        headers = {}
+        header_lines = 0
+        first_line = handle.readline()
+        while first_line.startswith("#"):
+            key, _, value = first_line[1:].strip().partition(":")
+            headers[key.strip().lower()] = value.strip()
+            header_lines += 1
+            first_line = handle.readline()
+
+        if "separator" in headers:
+            separator = ANKI_SEPARATORS.get(headers["separator"].lower(), headers["separator"])
+            if len(separator) != 1:
+                raise ValueError(f"Unsupported #separator header: {headers['separator']!r}")
+        elif file_format == "csv" or (file_format == "auto" and filename.lower().endswith(".csv")):
+            separator = ","
+        else:
+            separator = "\t"
+        # Anki numbers columns from 1; without a header the optional third column holds tags
+        tags_column = headers.get("tags column", "3")
+        if not tags_column.isdigit():
+            raise ValueError(f"Invalid #tags column header: {tags_column!r}")
+        tags_column = int(tags_column) - 1
+        is_html = headers.get("html", "").lower() == "true"
+
+        reader = csv.reader(chain([first_line], handle), delimiter=separator)
+        for fields in reader:
+            line_number = header_lines + reader.line_num
+            if not any(field.strip() for field in fields):
+                continue
+            if line_number == header_lines + 1 and [field.strip().lower() for field in fields[:2]] == ["question", "answer"]:
+                continue
+            tags = fields[tags_column].split() if tags_column >= 2 and len(fields) > tags_column else []
+            card_fields = [strip_html(field) if is_html else field for field in fields[:2]]
+            yield line_number, card_fields, tags
+
+
+def strip_html(text: str) -> str:
+    return html.unescape(re.sub(r"<[^>]+>", "", re.sub(r"<br\s*/?>", "\n", text))).strip()
@@ -0,0 +1,107 @@
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from utils import STORAGE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCKS_DIR = STORAGE_DIR / "locks"
+
+_thread_locks: dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+_held = threading.local()
+
+
+def _lock_file(handle):
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        return
+    handle.seek(0)
+    while True:
+        try:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue  # LK_LOCK gives up after ten seconds
+
+
+def _unlock_file(handle):
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _lock_path(key: str) -> Path:
+    return LOCKS_DIR / f"{key.replace('/', '_')}.lock"
+
+
+@contextmanager
+def _single_lock(key: str):
+    counts = _held.__dict__.setdefault("counts", {})
+    if counts.get(key):
+        counts[key] += 1
+        try:
+            yield
+        finally:
+            counts[key] -= 1
+        return
+
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(key, threading.Lock())
+    with thread_lock:
+        LOCKS_DIR.mkdir(exist_ok=True)
+        path = _lock_path(key)
+        while True:
+            handle = open(path, "a+b")
+            _lock_file(handle)
+            # The lock file may have been discarded while we waited, leaving us a lock nobody else sees
+            try:
+                if os.fstat(handle.fileno()).st_ino == os.stat(path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            _unlock_file(handle)
+            handle.close()
+        counts[key] = 1
+        try:
+            yield
+        finally:
+            counts[key] = 0
+            _unlock_file(handle)
+            handle.close()
+
+
+@contextmanager
+def document_lock(*paths: Path):
+    """
+    Holds the write locks of the given storage files against other threads
+    and other worker processes, so a read-modify-write of a document never
+    interleaves with another one. A thread may re-enter locks it holds.
+
+    Locks passed together are taken in sorted order. The sync journal and the
+    blob index are only ever locked after, never before, the documents being
+    changed, so writers touching several files cannot deadlock.
+    """
+    with ExitStack() as stack:
+        for key in sorted({path.as_posix() for path in paths}):
+            stack.enter_context(_single_lock(key))
+        yield
+
+
+def discard_lock(path: Path):
+    """
+    Deletes the lock file of a storage file that is being deleted for good.
+    Must be called while holding its lock; anyone waiting for it retries on
+    a new lock file.
+    """
+    try:
+        _lock_path(path.as_posix()).unlink(missing_ok=True)
+    except OSError:
+        pass  # Windows cannot delete a file that is still open
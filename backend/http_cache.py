@@ -0,0 +1,69 @@
+import json
+from hashlib import sha256
+from typing import Callable
+from fastapi import HTTPException, Request, Response
+from store import CachedDocument
+
+# Filtered views of one document version kept pre-serialized
+MAX_CACHED_VARIANTS = 32
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses weak comparison, so a W/ prefix is ignored
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def cached_json_response(
+    request: Request,
+    document: CachedDocument,
+    render: Callable[[], object],
+    variant: str = "",
+) -> Response:
+    """
+    Serves the JSON rendered from `document` with a strong ETag derived from
+    its version (and `variant`, for filtered views). Conditional requests for
+    the current version get a 304, and the serialized body is cached on the
+    document, so repeated reads of an unchanged file skip decryption and
+    JSON encoding alike.
+    """
+    version = document.version if not variant else sha256(f"{document.version}|{variant}".encode()).hexdigest()[:32]
+    etag = f'"{version}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    responses = document.derived.setdefault("responses", {})
+    body = responses.get(variant)
+    if body is None:
+        if len(responses) >= MAX_CACHED_VARIANTS:
+            responses.clear()
+        body = json.dumps(render(), ensure_ascii=False, separators=(",", ":")).encode()
+        responses[variant] = body
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+def parse_byte_range(range_header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Returns the inclusive (start, end) of a single "bytes=" range, or None when
+    the whole representation should be sent. Requests for several ranges get
+    the whole representation, which the Range spec allows.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    first, _, last = range_header.removeprefix("bytes=").strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
@@ -0,0 +1,85 @@
+"""
+Measures read throughput of the backend for different worker counts.
+
+    python load_test.py 1 2 4
+
+Each run starts uvicorn with the given number of workers on a fresh storage
+directory, seeds tasks and flashcards, then reads them from several client
+processes for a fixed time and reports requests per second.
+
+Clients on the same machine compete with the workers for CPU, so by default
+they get at most half of the cores. For a clean measurement, start the
+server on one machine and run only the clients on another:
+
+    uvicorn main:app --host 0.0.0.0 --workers 4        # on the server
+    python load_test.py --url http://server:8000 --clients 16
+
+An empty server is seeded before the clients start.
+"""
+import argparse
+import os
+import tempfile
+import time
+from multiprocessing import Pool
+from pathlib import Path
+import httpx
+from tests.helpers import backend_server
+
+DURATION = 10
+READ_PATHS = ["/tasks?status=todo", "/tasks?sort_by=due_date", "/flashcards", "/progress"]
+
+
+def read_for(url: str) -> int:
+    requests = 0
+    deadline = time.perf_counter() + DURATION
+    with httpx.Client(base_url=url) as client:
+        while time.perf_counter() < deadline:
+            client.get(READ_PATHS[requests % len(READ_PATHS)]).raise_for_status()
+            requests += 1
+    return requests
+
+
+def seed(url: str):
+    with httpx.Client(base_url=url) as client:
+        if client.get("/tasks").json():
+            return
+        for number in range(500):
+            client.post("/tasks", json={
+                "title": f"Task {number}",
+                "description": "Load test",
+                "status": ["todo", "in_progress", "done"][number % 3],
+                "due_date": f"2030-01-{number % 28 + 1:02d}",
+            }).raise_for_status()
+            client.post("/flashcards", json={"question": f"Question {number}", "answer": f"Answer {number}"}).raise_for_status()
+
+
+def measure(url: str, clients: int) -> float:
+    seed(url)
+    with Pool(clients) as pool:
+        total = sum(pool.map(read_for, [url] * clients))
+    return total / DURATION
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures read throughput of the backend.")
+    parser.add_argument("workers", nargs="*", type=int, default=[1, 2, 4], help="worker counts to start locally")
+    parser.add_argument("--url", help="measure a server that is already running instead of starting one")
+    parser.add_argument("--clients", type=int, help="client processes (default: half the local cores)")
+    args = parser.parse_args()
+    clients = args.clients or max(1, (os.cpu_count() or 1) // 2)
+    print(f"{os.cpu_count()} local CPUs, {clients} client processes, {DURATION}s per run")
+
+    if args.url:
+        print(f"{args.url}: {measure(args.url, clients):8.0f} req/s")
+        return
+    baseline = None
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as workdir:
+            with backend_server(Path(workdir), "--workers", str(workers), "--no-access-log") as url:
+                throughput = measure(url, clients)
+        baseline = baseline or throughput
+        print(f"{workers} workers: {throughput:8.0f} req/s  ({throughput / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
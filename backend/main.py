@@ -1,25 +1,88 @@
+import asyncio
+import copy
+import csv
+import logging
+import os
 import random
-from fastapi import FastAPI, HTTPException, UploadFile
+import shutil
+import httpx
+from fastapi import BackgroundTasks, Body, FastAPI, HTTPException, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
 from pathlib import Path
-import json
-from utils import encrypt_data, decrypt_data
+from typing import Literal, Optional
+from store import CachedDocument, load_document, read_json, write_json
+from coordinator import discard_lock, document_lock
+from task_index import TaskIndex
+from http_cache import cached_json_response, etag_matches, parse_byte_range
+from card_import import content_hash, read_rows
+from blob_store import BLOBS_DIR, add_refs, is_blob_id, load_index, read_range, release, store_blob
+from timer_archive import (
+    add_to_daily, archive_sessions, day_in_range, in_range, load_metrics, prune_segments, read_archive,
+)
+from sync import (
+    LOCAL_SETTINGS, SYNC_DIR, SYNC_FILE, changes_since, decode_batch, encode_batch, load_journal, new_journal, observe,
+    save_journal, shard_name, stamp, tick,
+)
 import zipfile
-from datetime import datetime, timedelta
-from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from uuid import uuid4
+from datetime import date, datetime, timedelta
+from pydantic import BaseModel, Field, ValidationError
 
 class TimerStartRequest(BaseModel):
     duration: int
 
+TaskStatus = Literal["todo", "in_progress", "done"]
+
 class Task(BaseModel):
     title: str
     description: str
+    status: TaskStatus = "todo"
+    due_date: Optional[date] = None
+    priority: int = Field(2, ge=1, le=3, description="1 = low, 2 = medium, 3 = high")
+    tags: list[str] = []
+    flashcard_ids: list[str] = Field([], description="Ids of linked flashcards")
+
+class Flashcard(BaseModel):
+    question: str = Field(..., min_length=1)
+    answer: str = Field(..., min_length=1)
+    tags: list[str] = []
+
+class Deck(BaseModel):
+    name: str = Field(..., min_length=1)
+
+class SyncRequest(BaseModel):
+    peer: str = Field(..., description="Base URL of the StudyHelper install to sync with")
 
 class ProgressUpdate(BaseModel):
     study_time: int = Field(..., ge=0, description="Study time in minutes")
     tasks_completed: int = Field(..., ge=0, description="Number of tasks completed")
 
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+async def run_compactor():
+    while True:
+        try:
+            interval = timedelta(minutes=retention_setting("timer_compaction_interval_minutes"))
+            await asyncio.sleep(interval.total_seconds())
+            # Every worker runs this loop, and a run by any of them covers the interval
+            last_run = load_metrics(COMPACTION_METRICS_FILE)["last_run"]
+            if last_run and datetime.now() - datetime.fromisoformat(last_run) < interval:
+                continue
+            await asyncio.to_thread(compact_timer_logs)
+        except Exception:
+            logger.exception("Timer log compaction failed")
+            # Waits before retrying, so a failure that repeats cannot spin the loop
+            await asyncio.sleep(TIMER_RETENTION_DEFAULTS["timer_compaction_interval_minutes"] * 60)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    compactor = asyncio.create_task(run_compactor())
+    yield
+    compactor.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 STORAGE_DIR = Path("storage")
 
@@ -29,86 +92,229 @@ PROGRESS_FILE = STORAGE_DIR / "progress.json"
 TIMER_FILE = STORAGE_DIR / "timer.json"
 FLASHCARDS_FILE = STORAGE_DIR / "flashcards.json"
 SETTINGS_FILE = STORAGE_DIR / "settings.json"
+DECKS_DIR = STORAGE_DIR / "decks"
+DECKS_MANIFEST = DECKS_DIR / "manifest.json"
+TIMER_ARCHIVE_DIR = STORAGE_DIR / "timer_archive"
+COMPACTION_METRICS_FILE = TIMER_ARCHIVE_DIR / "compaction.metrics"
+IMPORTS_DIR = STORAGE_DIR / "imports"
+
+# The default deck keeps its cards in the original flashcards file
+DEFAULT_DECK = "default"
+
+# Models that record values received from a sync peer must match
+SYNC_SCHEMAS = {"task": Task, "deck": Deck, "card": Flashcard}
+
+# Timer retention settings used until the user changes them
+TIMER_RETENTION_DEFAULTS = {
+    "timer_log_retention_days": 30,  # Raw sessions kept in the timer file
+    "timer_archive_retention_days": None,  # Sessions kept in cold segments, None keeps them forever
+    "timer_compaction_interval_minutes": 60,
+}
+
+# Imported cards are committed to their deck at least this many at a time
+IMPORT_BATCH_SIZE = 1000
+
+def ensure_document(path: Path, default):
+    # Workers start at the same time, so only one of them may create each file
+    with document_lock(path):
+        if not path.exists():
+            write_json(path, default)
 
 # Ensure storage directory and task/progress files exist
 STORAGE_DIR.mkdir(exist_ok=True)
 
 # Ensure the settings file exists
-if not SETTINGS_FILE.exists():
-    SETTINGS_FILE.write_text(encrypt_data(json.dumps({"storage_path": str(STORAGE_DIR)})))
+ensure_document(SETTINGS_FILE, {"storage_path": str(STORAGE_DIR)})
 
 # Ensure the flashcards file exists
-if not FLASHCARDS_FILE.exists():
-    FLASHCARDS_FILE.write_text(encrypt_data(json.dumps([])))  # Empty flashcards list
+ensure_document(FLASHCARDS_FILE, [])  # Empty flashcards list
+
+# Ensure the deck manifest exists
+DECKS_DIR.mkdir(exist_ok=True)
+if not DECKS_MANIFEST.exists():
+    ensure_document(DECKS_MANIFEST, {DEFAULT_DECK: {"name": "Default", "card_count": len(read_json(FLASHCARDS_FILE))}})
 
 # Ensure the timer file exists
-if not TIMER_FILE.exists():
-    TIMER_FILE.write_text(encrypt_data(json.dumps({"status": "idle", "start_time": None, "duration": 0, "logs": []})))
+ensure_document(TIMER_FILE, {"status": "idle", "start_time": None, "duration": 0, "logs": []})
 
 # Initialize files if they don't exist
-if not TASKS_FILE.exists():
-    TASKS_FILE.write_text(encrypt_data("[]"))  # Empty encrypted task list
-
-if not PROGRESS_FILE.exists():
-    PROGRESS_FILE.write_text(encrypt_data("{}"))  # Empty encrypted progress data
+ensure_document(TASKS_FILE, [])  # Empty encrypted task list
+ensure_document(PROGRESS_FILE, {})  # Empty encrypted progress data
 
 @app.get("/")
 def read_root():
     return {"message": "Backend is working"}
 
+def tasks_document() -> CachedDocument:
+    """
+    Returns the cached task document with its task index. Its data, index and
+    cached responses all belong to the same version of the file.
+    """
+    document = load_document(TASKS_FILE)
+    if "index" not in document.derived:
+        if any("uid" not in task for task in document.data):
+            # Tasks stored before they had a stable id get one for syncing
+            with document_lock(TASKS_FILE):
+                document = load_document(TASKS_FILE)  # Another worker may have written since
+                tasks = [task if "uid" in task else {**task, "uid": uuid4().hex} for task in document.data]
+                added = [new["uid"] for new, old in zip(tasks, document.data) if new is not old]
+                if added:
+                    document = write_json(TASKS_FILE, tasks)
+                    record_changes([f"task/{uid}" for uid in added])
+        document.derived["index"] = TaskIndex(document.data)
+    return document
+
+def load_tasks() -> tuple[list[dict], TaskIndex]:
+    document = tasks_document()
+    return document.data, document.derived["index"]
+
+def edit_tasks() -> tuple[list[dict], TaskIndex]:
+    # Readers share the cached list and index, so writers change copies
+    tasks, index = load_tasks()
+    return list(tasks), index.copy()
+
+def query_tasks(
+    tasks: list[dict],
+    index: TaskIndex,
+    status: Optional[str],
+    tag: Optional[str],
+    due_after: Optional[date],
+    due_before: Optional[date],
+    sort_by: Optional[str],
+    descending: bool,
+) -> list[dict]:
+    matches = index.query(
+        status=status,
+        tag=tag,
+        due_after=due_after and due_after.isoformat(),
+        due_before=due_before and due_before.isoformat(),
+    )
+
+    if sort_by == "due_date":
+        # Walk the due date index in order instead of sorting; undated tasks go last
+        dated = [task_id for _, task_id in index.due_range() if matches is None or task_id in matches]
+        if descending:
+            dated.reverse()
+        dated_ids = set(dated)
+        undated = [task_id for task_id in (sorted(matches) if matches is not None else range(len(tasks)))
+                   if task_id not in dated_ids]
+        task_ids = dated + undated
+    else:
+        task_ids = sorted(matches) if matches is not None else range(len(tasks))
+        if sort_by == "priority":
+            task_ids = sorted(task_ids, key=lambda task_id: tasks[task_id].get("priority", 2), reverse=descending)
+        elif sort_by == "title":
+            task_ids = sorted(task_ids, key=lambda task_id: tasks[task_id]["title"].lower(), reverse=descending)
+        elif descending:
+            task_ids = reversed(task_ids)
+
+    return [{"id": task_id, **tasks[task_id]} for task_id in task_ids]
+
 @app.get("/tasks")
-def get_tasks():
-    tasks = decrypt_data(TASKS_FILE.read_text())
-    return json.loads(tasks)
+def get_tasks(
+    request: Request,
+    status: Optional[TaskStatus] = None,
+    tag: Optional[str] = None,
+    due_after: Optional[date] = None,
+    due_before: Optional[date] = None,
+    sort_by: Optional[Literal["due_date", "priority", "title"]] = None,
+    descending: bool = False,
+):
+    # The body and its ETag must come from the same version of the file
+    document = tasks_document()
+    query = (status, tag, due_after, due_before, sort_by, descending)
+    return cached_json_response(
+        request,
+        document,
+        lambda: query_tasks(document.data, document.derived["index"], *query),
+        variant=repr(query),
+    )
 
 @app.post("/tasks")
 def add_task(task: Task):
-    tasks = json.loads(decrypt_data(TASKS_FILE.read_text()))
-    tasks.append(task.dict())
-    TASKS_FILE.write_text(encrypt_data(json.dumps(tasks, indent=4)))
-    return {"message": "Task added successfully"}
+    with document_lock(TASKS_FILE):
+        tasks, index = edit_tasks()
+        record = {"uid": uuid4().hex, **task.model_dump(mode="json")}
+        tasks.append(record)
+        index.add(len(tasks) - 1, record)
+        write_json(TASKS_FILE, tasks, derived={"index": index})
+        record_changes([f"task/{record['uid']}"])
+        return {"message": "Task added successfully"}
+
+@app.put("/tasks/{task_id}")
+def update_task(task_id: int, task: Task):
+    with document_lock(TASKS_FILE):
+        tasks, index = edit_tasks()
+        if task_id < 0 or task_id >= len(tasks):
+            raise HTTPException(status_code=404, detail="Task not found")
+        record = {"uid": tasks[task_id]["uid"], **task.model_dump(mode="json")}
+        index.remove(task_id, tasks[task_id])
+        tasks[task_id] = record
+        index.add(task_id, record)
+        write_json(TASKS_FILE, tasks, derived={"index": index})
+        record_changes([f"task/{record['uid']}"])
+        return {"message": "Task updated successfully"}
 
 @app.delete("/tasks/{task_id}")
 def delete_task(task_id: int):
-    tasks = json.loads(decrypt_data(TASKS_FILE.read_text()))
-    if task_id < 0 or task_id >= len(tasks):
-        raise HTTPException(status_code=404, detail="Task not found")
-    tasks.pop(task_id)
-    TASKS_FILE.write_text(encrypt_data(json.dumps(tasks, indent=4)))
-    return {"message": "Task deleted successfully"}
+    with document_lock(TASKS_FILE):
+        tasks = list(load_tasks()[0])
+        if task_id < 0 or task_id >= len(tasks):
+            raise HTTPException(status_code=404, detail="Task not found")
+        removed = tasks.pop(task_id)
+        # Positions after the deleted task shift down, so the index is rebuilt on next read
+        write_json(TASKS_FILE, tasks)
+        record_changes([f"task/{removed['uid']}"], deleted=True)
+        return {"message": "Task deleted successfully"}
 
 @app.get("/progress")
-def get_progress():
-    progress = decrypt_data(PROGRESS_FILE.read_text())
-    return json.loads(progress)
+def get_progress(request: Request):
+    document = load_document(PROGRESS_FILE)
+    return cached_json_response(request, document, lambda: document.data)
 
 @app.post("/progress")
 def update_progress(update: ProgressUpdate):
-    progress = json.loads(decrypt_data(PROGRESS_FILE.read_text()))
-    for key, value in update.model_dump().items():
-        progress[key] = progress.get(key, 0) + value
-    PROGRESS_FILE.write_text(encrypt_data(json.dumps(progress, indent=4)))
-    return {"message": "Progress updated successfully"}
+    with document_lock(PROGRESS_FILE):
+        progress = dict(read_json(PROGRESS_FILE))
+        for key, value in update.model_dump().items():
+            progress[key] = progress.get(key, 0) + value
+        write_json(PROGRESS_FILE, progress)
+        return {"message": "Progress updated successfully"}
 
 @app.get("/export")
 def export_data():
     export_file = STORAGE_DIR / "data_export.zip"
-    with zipfile.ZipFile(export_file, "w") as zipf:
-        for file in STORAGE_DIR.glob("*.json"):
-            zipf.write(file, file.name)
+    temp_file = STORAGE_DIR / f"data_export_{uuid4().hex}.tmp"
+    with zipfile.ZipFile(temp_file, "w") as zipf:
+        for file in [*STORAGE_DIR.rglob("*.json"), *TIMER_ARCHIVE_DIR.glob("*.seg"), *BLOBS_DIR.rglob("*.blob")]:
+            if file == SYNC_FILE or SYNC_DIR in file.parents:
+                continue  # Sync state belongs to this install
+            zipf.write(file, file.relative_to(STORAGE_DIR).as_posix())
+    os.replace(temp_file, export_file)
     return {"message": f"Data exported successfully. File: {export_file}"}
 
 @app.post("/import")
 def import_data(file: UploadFile):
     # Save uploaded file temporarily
-    temp_file = STORAGE_DIR / "uploaded_data.zip"
+    temp_file = STORAGE_DIR / f"uploaded_data_{uuid4().hex}.zip"
     with open(temp_file, "wb") as f:
-        f.write(file.file.read())
+        shutil.copyfileobj(file.file, f, 1024 * 1024)
 
     # Validate and extract uploaded ZIP file
     try:
         with zipfile.ZipFile(temp_file, "r") as zipf:
-            zipf.extractall(STORAGE_DIR)
+            members = [info for info in zipf.infolist() if not info.is_dir()]
+            names = [Path(info.filename) for info in members]
+            if any(name.is_absolute() or ".." in name.parts for name in names):
+                raise HTTPException(status_code=400, detail="Invalid ZIP file")
+            targets = [STORAGE_DIR / name for name in names]
+            # Each file is replaced atomically while its writers are held off
+            with document_lock(*targets):
+                for info, target in zip(members, targets):
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    extracted = target.with_name(f"{target.name}.{uuid4().hex}.tmp")
+                    extracted.write_bytes(zipf.read(info))
+                    os.replace(extracted, target)
     except zipfile.BadZipFile:
         raise HTTPException(status_code=400, detail="Invalid ZIP file")
     finally:
@@ -118,99 +324,749 @@ def import_data(file: UploadFile):
 
 @app.post("/timer/start")
 def start_timer(request: TimerStartRequest):
-    timer_data = json.loads(decrypt_data(TIMER_FILE.read_text()))
-    if timer_data["status"] == "active":
-        raise HTTPException(status_code=400, detail="Timer is already running")
-
-    timer_data["status"] = "active"
-    timer_data["start_time"] = datetime.now().isoformat()
-    timer_data["duration"] = request.duration
-    TIMER_FILE.write_text(encrypt_data(json.dumps(timer_data, indent=4)))
+    with document_lock(TIMER_FILE):
+        timer_data = copy.deepcopy(read_json(TIMER_FILE))
+        if timer_data["status"] == "active":
+            raise HTTPException(status_code=400, detail="Timer is already running")
+
+        timer_data["status"] = "active"
+        timer_data["start_time"] = datetime.now().isoformat()
+        timer_data["duration"] = request.duration
+        write_json(TIMER_FILE, timer_data)
     return {"message": "Timer started"}
 
 @app.post("/timer/pause")
 def pause_timer():
-    timer_data = json.loads(decrypt_data(TIMER_FILE.read_text()))
-    if timer_data["status"] != "active":
-        raise HTTPException(status_code=400, detail="No active timer to pause")
-
-    elapsed_time = (datetime.now() - datetime.fromisoformat(timer_data["start_time"])).total_seconds()
-    timer_data["status"] = "paused"
-    timer_data["duration"] = max(0, timer_data["duration"] - elapsed_time)
-    TIMER_FILE.write_text(encrypt_data(json.dumps(timer_data, indent=4)))
+    with document_lock(TIMER_FILE):
+        timer_data = copy.deepcopy(read_json(TIMER_FILE))
+        if timer_data["status"] != "active":
+            raise HTTPException(status_code=400, detail="No active timer to pause")
+
+        elapsed_time = (datetime.now() - datetime.fromisoformat(timer_data["start_time"])).total_seconds()
+        timer_data["status"] = "paused"
+        timer_data["duration"] = max(0, timer_data["duration"] - elapsed_time)
+        write_json(TIMER_FILE, timer_data)
     return {"message": "Timer paused"}
 
 @app.post("/timer/complete")
 def complete_timer():
-    timer_data = json.loads(decrypt_data(TIMER_FILE.read_text()))
-    if timer_data["status"] != "active":
-        raise HTTPException(status_code=400, detail="No active timer to complete")
-
-    end_time = datetime.now().isoformat()
-    log_entry = {
-        "start_time": timer_data["start_time"],
-        "end_time": end_time,
-        "duration": timer_data["duration"],
-    }
-    timer_data["logs"].append(log_entry)
-    timer_data["status"] = "idle"
-    timer_data["start_time"] = None
-    timer_data["duration"] = 0
-    TIMER_FILE.write_text(encrypt_data(json.dumps(timer_data, indent=4)))
+    with document_lock(TIMER_FILE):
+        timer_data = copy.deepcopy(read_json(TIMER_FILE))
+        if timer_data["status"] != "active":
+            raise HTTPException(status_code=400, detail="No active timer to complete")
+
+        end_time = datetime.now().isoformat()
+        log_entry = {
+            "start_time": timer_data["start_time"],
+            "end_time": end_time,
+            "duration": timer_data["duration"],
+        }
+        timer_data["logs"].append(log_entry)
+        timer_data["status"] = "idle"
+        timer_data["start_time"] = None
+        timer_data["duration"] = 0
+        write_json(TIMER_FILE, timer_data)
     return {"message": "Timer completed"}
 
 
 @app.get("/timer/status")
 def get_timer_status():
-    timer_data = json.loads(decrypt_data(TIMER_FILE.read_text()))
+    timer_data = read_json(TIMER_FILE)
     return timer_data
 
+@app.get("/timer/history")
+def get_timer_history(start: Optional[date] = None, end: Optional[date] = None):
+    """
+    Returns raw sessions that ended in the range, from the cold archive
+    segments and the recent logs in the timer file.
+    """
+    sessions = read_archive(TIMER_ARCHIVE_DIR, start, end) if TIMER_ARCHIVE_DIR.exists() else []
+    sessions.extend(log for log in read_json(TIMER_FILE)["logs"] if in_range(log, start, end))
+    return sessions
+
+@app.get("/timer/daily")
+def get_timer_daily(start: Optional[date] = None, end: Optional[date] = None):
+    timer_data = read_json(TIMER_FILE)
+    daily = {
+        day: dict(totals) for day, totals in timer_data.get("daily", {}).items() if day_in_range(day, start, end)
+    }
+    add_to_daily(daily, [log for log in timer_data["logs"] if in_range(log, start, end)])
+    return dict(sorted(daily.items()))
+
+def retention_setting(name: str) -> int | None:
+    """
+    Returns a timer retention setting, falling back to its default when the
+    stored value is not a positive whole number. Only archive retention may
+    be None, which keeps archived sessions forever.
+    """
+    default = TIMER_RETENTION_DEFAULTS[name]
+    value = read_json(SETTINGS_FILE).get(name, default)
+    if value is None and default is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        return default
+    return value
+
+def compact_timer_logs(now: datetime | None = None) -> dict:
+    """
+    Moves sessions older than the log retention window out of the timer file:
+    they are added to the daily aggregates and archived in compressed,
+    encrypted monthly segments. Segments older than the archive retention
+    window are deleted.
+    """
+    now = now or datetime.now()
+    # Other workers compact too, and segments are only written or pruned under both locks
+    with document_lock(TIMER_FILE, TIMER_ARCHIVE_DIR):
+        size_before = TIMER_FILE.stat().st_size
+        timer_data = copy.deepcopy(read_json(TIMER_FILE))
+        cutoff = (now - timedelta(days=retention_setting("timer_log_retention_days"))).isoformat()
+        expired = [log for log in timer_data["logs"] if log["end_time"] < cutoff]
+        if expired:
+            # Archive first, so an interrupted run never loses sessions
+            archive_sessions(TIMER_ARCHIVE_DIR, expired)
+            add_to_daily(timer_data.setdefault("daily", {}), expired)
+            timer_data["logs"] = [log for log in timer_data["logs"] if log["end_time"] >= cutoff]
+            write_json(TIMER_FILE, timer_data)
+        bytes_reclaimed = max(0, size_before - TIMER_FILE.stat().st_size)
+
+        pruned = 0
+        archive_days = retention_setting("timer_archive_retention_days")
+        if archive_days is not None and TIMER_ARCHIVE_DIR.exists():
+            pruned, pruned_size = prune_segments(TIMER_ARCHIVE_DIR, now - timedelta(days=archive_days))
+            bytes_reclaimed += pruned_size
+
+    # Metrics are kept on disk so every worker reports the same totals
+    with document_lock(COMPACTION_METRICS_FILE):
+        metrics = load_metrics(COMPACTION_METRICS_FILE)
+        metrics["runs"] += 1
+        metrics["last_run"] = now.isoformat()
+        metrics["sessions_archived"] += len(expired)
+        metrics["segments_pruned"] += pruned
+        metrics["bytes_reclaimed"] += bytes_reclaimed
+        TIMER_ARCHIVE_DIR.mkdir(exist_ok=True)
+        write_json(COMPACTION_METRICS_FILE, metrics)
+    return {"sessions_archived": len(expired), "segments_pruned": pruned, "bytes_reclaimed": bytes_reclaimed}
+
+@app.post("/timer/compact")
+def compact_timer():
+    return {"message": "Timer logs compacted", **compact_timer_logs()}
+
+@app.get("/timer/compaction")
+def get_compaction_metrics():
+    return load_metrics(COMPACTION_METRICS_FILE)
+
+def load_manifest() -> dict:
+    if not DECKS_MANIFEST.exists():
+        return {DEFAULT_DECK: {"name": "Default", "card_count": 0}}
+    return read_json(DECKS_MANIFEST)
+
+def deck_path(deck_id: str) -> Path:
+    return FLASHCARDS_FILE if deck_id == DEFAULT_DECK else DECKS_DIR / f"{deck_id}.json"
+
+def deck_file(deck_id: str) -> Path:
+    # Only ids from the manifest are ever used to open files
+    if deck_id not in load_manifest():
+        raise HTTPException(status_code=404, detail="Deck not found")
+    return deck_path(deck_id)
+
+def deck_document(deck_id: str) -> CachedDocument:
+    """
+    Returns the cached document of a single deck shard, giving an id to any
+    card that was stored before cards had one.
+    """
+    path = deck_file(deck_id)
+    document = load_document(path)
+    if "ids_assigned" not in document.derived:
+        if any("id" not in card for card in document.data):
+            with document_lock(path):
+                document = load_document(path)  # Another worker may have written since
+                cards = [card if "id" in card else {**card, "id": uuid4().hex} for card in document.data]
+                added = [new["id"] for new, old in zip(cards, document.data) if new is not old]
+                if added:
+                    document = write_json(path, cards)
+                    record_changes([f"card/{deck_id}/{card_id}" for card_id in added])
+        document.derived["ids_assigned"] = True
+    return document
+
+def load_deck(deck_id: str) -> list[dict]:
+    return deck_document(deck_id).data
+
+def save_deck(deck_id: str, cards: list[dict]):
+    write_json(deck_file(deck_id), cards, derived={"ids_assigned": True})
+    manifest = copy.deepcopy(load_manifest())
+    if manifest[deck_id]["card_count"] != len(cards):
+        manifest[deck_id]["card_count"] = len(cards)
+        write_json(DECKS_MANIFEST, manifest)
+
+def card_record(card_id: str, flashcard: Flashcard, previous: dict | None = None) -> dict:
+    record = {"id": card_id, **flashcard.model_dump()}
+    # Attachments are managed through their own endpoints and survive edits
+    if previous and previous.get("attachments"):
+        record["attachments"] = previous["attachments"]
+    return record
+
+def attachment_ids(cards: list[dict]) -> list[str]:
+    return [attachment["id"] for card in cards for attachment in card.get("attachments", [])]
+
+def find_card(cards: list[dict], card_id: str) -> int:
+    for position, card in enumerate(cards):
+        if card["id"] == card_id:
+            return position
+    raise HTTPException(status_code=404, detail="Flashcard not found")
+
+@app.get("/decks")
+def get_decks():
+    return [{"id": deck_id, **deck} for deck_id, deck in load_manifest().items()]
+
+@app.post("/decks")
+def add_deck(deck: Deck):
+    with document_lock(DECKS_MANIFEST):
+        manifest = copy.deepcopy(load_manifest())
+        deck_id = uuid4().hex
+        write_json(DECKS_DIR / f"{deck_id}.json", [])
+        manifest[deck_id] = {"name": deck.name, "card_count": 0}
+        write_json(DECKS_MANIFEST, manifest)
+        record_changes([f"deck/{deck_id}"])
+        return {"message": "Deck created successfully", "id": deck_id}
+
+@app.put("/decks/{deck_id}")
+def rename_deck(deck_id: str, deck: Deck):
+    with document_lock(DECKS_MANIFEST):
+        manifest = copy.deepcopy(load_manifest())
+        if deck_id not in manifest:
+            raise HTTPException(status_code=404, detail="Deck not found")
+        manifest[deck_id]["name"] = deck.name
+        write_json(DECKS_MANIFEST, manifest)
+        record_changes([f"deck/{deck_id}"])
+        return {"message": "Deck updated successfully"}
+
+@app.delete("/decks/{deck_id}")
+def delete_deck(deck_id: str):
+    if deck_id == DEFAULT_DECK:
+        raise HTTPException(status_code=400, detail="The default deck cannot be deleted")
+    with document_lock(deck_file(deck_id), DECKS_MANIFEST):
+        path = deck_file(deck_id)
+        released = attachment_ids(load_deck(deck_id))
+        manifest = copy.deepcopy(load_manifest())
+        manifest.pop(deck_id)
+        write_json(DECKS_MANIFEST, manifest)
+        path.unlink(missing_ok=True)
+        discard_lock(path)
+        release(released)
+        record_changes([f"deck/{deck_id}"], deleted=True)
+        return {"message": "Deck deleted successfully"}
+
+@app.get("/decks/{deck_id}/flashcards")
+def get_deck_flashcards(deck_id: str, request: Request):
+    document = deck_document(deck_id)
+    return cached_json_response(request, document, lambda: document.data)
+
+@app.post("/decks/{deck_id}/flashcards")
+def add_deck_flashcard(deck_id: str, flashcard: Flashcard):
+    with document_lock(deck_file(deck_id), DECKS_MANIFEST):
+        cards = list(load_deck(deck_id))
+        card_id = uuid4().hex
+        cards.append(card_record(card_id, flashcard))
+        save_deck(deck_id, cards)
+        record_changes([f"card/{deck_id}/{card_id}"])
+        return {"message": "Flashcard added successfully", "id": card_id}
+
+@app.put("/decks/{deck_id}/flashcards/{card_id}")
+def update_deck_flashcard(deck_id: str, card_id: str, flashcard: Flashcard):
+    with document_lock(deck_file(deck_id), DECKS_MANIFEST):
+        cards = list(load_deck(deck_id))
+        position = find_card(cards, card_id)
+        cards[position] = card_record(card_id, flashcard, cards[position])
+        save_deck(deck_id, cards)
+        record_changes([f"card/{deck_id}/{card_id}"])
+        return {"message": "Flashcard updated successfully"}
+
+@app.delete("/decks/{deck_id}/flashcards/{card_id}")
+def delete_deck_flashcard(deck_id: str, card_id: str):
+    with document_lock(deck_file(deck_id), DECKS_MANIFEST):
+        cards = list(load_deck(deck_id))
+        removed = cards.pop(find_card(cards, card_id))
+        save_deck(deck_id, cards)
+        record_changes([f"card/{deck_id}/{card_id}"], deleted=True)
+        release(attachment_ids([removed]))
+        return {"message": "Flashcard deleted successfully"}
+
+@app.post("/decks/{deck_id}/flashcards/{card_id}/attachments")
+def add_attachment(deck_id: str, card_id: str, file: UploadFile):
+    with document_lock(deck_file(deck_id), DECKS_MANIFEST):
+        cards = list(load_deck(deck_id))
+        position = find_card(cards, card_id)
+        blob = store_blob(file.file, file.content_type or "application/octet-stream")
+        attachments = cards[position].get("attachments", [])
+        if any(attachment["id"] == blob["id"] for attachment in attachments):
+            release([blob["id"]])  # The card already holds a reference to this content
+        else:
+            cards[position] = {**cards[position], "attachments": [*attachments, {**blob, "name": file.filename}]}
+            save_deck(deck_id, cards)
+            record_changes([f"card/{deck_id}/{card_id}"])
+        return {"message": "Attachment added successfully", **blob}
+
+@app.delete("/decks/{deck_id}/flashcards/{card_id}/attachments/{attachment_id}")
+def delete_attachment(deck_id: str, card_id: str, attachment_id: str):
+    with document_lock(deck_file(deck_id), DECKS_MANIFEST):
+        cards = list(load_deck(deck_id))
+        position = find_card(cards, card_id)
+        attachments = cards[position].get("attachments", [])
+        remaining = [attachment for attachment in attachments if attachment["id"] != attachment_id]
+        if len(remaining) == len(attachments):
+            raise HTTPException(status_code=404, detail="Attachment not found")
+        cards[position] = {**cards[position], "attachments": remaining}
+        save_deck(deck_id, cards)
+        record_changes([f"card/{deck_id}/{card_id}"])
+        release([attachment_id])
+        return {"message": "Attachment deleted successfully"}
+
+@app.get("/attachments/{attachment_id}")
+def get_attachment(attachment_id: str, request: Request):
+    """
+    Streams an attachment, or the single byte range asked for in a Range
+    header. Attachment ids are content hashes, so they double as ETags.
+    """
+    blob = load_index().get(attachment_id) if is_blob_id(attachment_id) else None
+    if blob is None or "size" not in blob:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    headers = {"ETag": f'"{attachment_id}"', "Accept-Ranges": "bytes"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    size = blob["size"]
+    byte_range = parse_byte_range(request.headers.get("range"), size) if size else None
+    if byte_range is None:
+        return StreamingResponse(
+            read_range(attachment_id, 0, size - 1) if size else iter(()),
+            media_type=blob["content_type"],
+            headers={**headers, "Content-Length": str(size)},
+        )
+    start, end = byte_range
+    return StreamingResponse(
+        read_range(attachment_id, start, end),
+        status_code=206,
+        media_type=blob["content_type"],
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)},
+    )
+
+@app.get("/decks/{deck_id}/quiz")
+def quiz_deck(deck_id: str, count: int = 5):
+    cards = load_deck(deck_id)
+    if not cards:
+        raise HTTPException(status_code=404, detail="No flashcards available")
+    return random.sample(cards, min(count, len(cards)))
+
+@app.get("/decks/{deck_id}/export")
+def export_deck(deck_id: str):
+    cards = load_deck(deck_id)
+    return {"name": load_manifest()[deck_id]["name"], "flashcards": cards}
+
+def import_job_file(import_id: str) -> Path:
+    return IMPORTS_DIR / f"{import_id}.job"
+
+def commit_import_batch(deck_id: str, batch: list[dict], job: dict):
+    with document_lock(deck_file(deck_id), DECKS_MANIFEST):
+        cards = [*load_deck(deck_id), *batch]
+        save_deck(deck_id, cards)
+        record_changes([f"card/{deck_id}/{card['id']}" for card in batch])
+        job["imported"] += len(batch)
+        job["batches"] += 1
+    # Progress lives on disk so any worker can report it
+    write_json(import_job_file(job["import_id"]), copy.deepcopy(job))
+
+def run_import(job: dict, path: Path, file_format: str, filename: str):
+    """
+    Streams the uploaded rows into the deck, skipping invalid rows and cards
+    whose content is already in the deck or earlier in the file, and commits
+    the new cards in batches while recording progress on the job.
+
+    Every commit rewrites the whole deck shard, so a batch is never smaller
+    than the deck it goes into: batch sizes grow geometrically and each card
+    is written a bounded number of times however large the import is.
+    """
+    deck_id = job["deck_id"]
+    try:
+        cards = load_deck(deck_id)
+        # Legacy cards may lack a question or answer, and cannot be duplicated by an import
+        seen = {
+            content_hash(card["question"], card["answer"])
+            for card in cards
+            if isinstance(card.get("question"), str) and isinstance(card.get("answer"), str)
+        }
+        deck_size = len(cards)
+        batch = []
+        for line_number, fields, tags in read_rows(path, file_format, filename):
+            job["rows"] += 1
+            try:
+                flashcard = Flashcard(question=fields[0], answer=fields[1], tags=tags)
+            except (IndexError, ValidationError):
+                job["invalid"] += 1
+                if len(job["errors"]) < 20:
+                    job["errors"].append({"line": line_number, "detail": "Expected a non-empty question and answer"})
+                continue
+            card_hash = content_hash(flashcard.question, flashcard.answer)
+            if card_hash in seen:
+                job["duplicates"] += 1
+                continue
+            seen.add(card_hash)
+            batch.append(card_record(uuid4().hex, flashcard))
+            if len(batch) >= max(IMPORT_BATCH_SIZE, deck_size):
+                commit_import_batch(deck_id, batch, job)
+                deck_size += len(batch)
+                batch = []
+        if batch:
+            commit_import_batch(deck_id, batch, job)
+        job["status"] = "completed"
+    except (OSError, ValueError, csv.Error, HTTPException) as error:
+        job["status"] = "failed"
+        job["errors"].append({"line": None, "detail": str(error)})
+    except Exception:
+        # Nothing else reports failures of a background task, so the job must not stay "running"
+        logger.exception("Import %s failed", job["import_id"])
+        job["status"] = "failed"
+        job["errors"].append({"line": None, "detail": "Import failed unexpectedly"})
+    finally:
+        path.unlink(missing_ok=True)
+        write_json(import_job_file(job["import_id"]), copy.deepcopy(job))
+
+@app.post("/decks/{deck_id}/import")
+def import_deck(
+    deck_id: str,
+    file: UploadFile,
+    background_tasks: BackgroundTasks,
+    format: Literal["auto", "csv", "tsv", "anki"] = "auto",
+):
+    """
+    Starts a bulk import of a CSV, TSV or Anki text export into the deck.
+    Progress is reported by GET /imports/{import_id}.
+    """
+    deck_file(deck_id)
+    import_id = uuid4().hex
+    upload_path = STORAGE_DIR / f"import_{import_id}.tmp"
+    with open(upload_path, "wb") as upload:
+        shutil.copyfileobj(file.file, upload, 1024 * 1024)
+    job = {
+        "import_id": import_id,
+        "deck_id": deck_id,
+        "status": "running",
+        "rows": 0,
+        "imported": 0,
+        "duplicates": 0,
+        "invalid": 0,
+        "batches": 0,
+        "errors": [],
+    }
+    IMPORTS_DIR.mkdir(exist_ok=True)
+    write_json(import_job_file(import_id), copy.deepcopy(job))
+    background_tasks.add_task(run_import, job, upload_path, format, file.filename or "")
+    return {"message": "Import started", "import_id": import_id}
+
+@app.get("/imports/{import_id}")
+def get_import_progress(import_id: str):
+    if not import_job_file(import_id).exists():
+        raise HTTPException(status_code=404, detail="Import not found")
+    return read_json(import_job_file(import_id))
+
+# The original flashcard endpoints address the default deck by position
 @app.get("/flashcards")
-def get_flashcards():
-    flashcards = decrypt_data(FLASHCARDS_FILE.read_text())
-    return json.loads(flashcards)
+def get_flashcards(request: Request):
+    return get_deck_flashcards(DEFAULT_DECK, request)
 
 @app.post("/flashcards")
-def add_flashcard(flashcard: dict):
-    flashcards = json.loads(decrypt_data(FLASHCARDS_FILE.read_text()))
-    flashcards.append(flashcard)
-    FLASHCARDS_FILE.write_text(encrypt_data(json.dumps(flashcards, indent=4)))
-    return {"message": "Flashcard added successfully"}
+def add_flashcard(flashcard: Flashcard):
+    with document_lock(FLASHCARDS_FILE, DECKS_MANIFEST):
+        flashcards = list(load_deck(DEFAULT_DECK))
+        card_id = uuid4().hex
+        flashcards.append(card_record(card_id, flashcard))
+        save_deck(DEFAULT_DECK, flashcards)
+        record_changes([f"card/{DEFAULT_DECK}/{card_id}"])
+        return {"message": "Flashcard added successfully"}
 
 @app.put("/flashcards/{flashcard_id}")
-def update_flashcard(flashcard_id: int, flashcard: dict):
-    flashcards = json.loads(decrypt_data(FLASHCARDS_FILE.read_text()))
-    if flashcard_id < 0 or flashcard_id >= len(flashcards):
-        raise HTTPException(status_code=404, detail="Flashcard not found")
-    flashcards[flashcard_id] = flashcard
-    FLASHCARDS_FILE.write_text(encrypt_data(json.dumps(flashcards, indent=4)))
-    return {"message": "Flashcard updated successfully"}
+def update_flashcard(flashcard_id: int, flashcard: Flashcard):
+    with document_lock(FLASHCARDS_FILE, DECKS_MANIFEST):
+        flashcards = list(load_deck(DEFAULT_DECK))
+        if flashcard_id < 0 or flashcard_id >= len(flashcards):
+            raise HTTPException(status_code=404, detail="Flashcard not found")
+        card_id = flashcards[flashcard_id]["id"]
+        flashcards[flashcard_id] = card_record(card_id, flashcard, flashcards[flashcard_id])
+        save_deck(DEFAULT_DECK, flashcards)
+        record_changes([f"card/{DEFAULT_DECK}/{card_id}"])
+        return {"message": "Flashcard updated successfully"}
 
 @app.delete("/flashcards/{flashcard_id}")
 def delete_flashcard(flashcard_id: int):
-    flashcards = json.loads(decrypt_data(FLASHCARDS_FILE.read_text()))
-    if flashcard_id < 0 or flashcard_id >= len(flashcards):
-        raise HTTPException(status_code=404, detail="Flashcard not found")
-    flashcards.pop(flashcard_id)
-    FLASHCARDS_FILE.write_text(encrypt_data(json.dumps(flashcards, indent=4)))
-    return {"message": "Flashcard deleted successfully"}
+    with document_lock(FLASHCARDS_FILE, DECKS_MANIFEST):
+        flashcards = list(load_deck(DEFAULT_DECK))
+        if flashcard_id < 0 or flashcard_id >= len(flashcards):
+            raise HTTPException(status_code=404, detail="Flashcard not found")
+        removed = flashcards.pop(flashcard_id)
+        save_deck(DEFAULT_DECK, flashcards)
+        record_changes([f"card/{DEFAULT_DECK}/{removed['id']}"], deleted=True)
+        release(attachment_ids([removed]))
+        return {"message": "Flashcard deleted successfully"}
 
 @app.get("/flashcards/quiz")
 def quiz_flashcards(count: int = 5):
-    flashcards = json.loads(decrypt_data(FLASHCARDS_FILE.read_text()))
-    if not flashcards:
-        raise HTTPException(status_code=404, detail="No flashcards available")
-    return random.sample(flashcards, min(count, len(flashcards)))
+    return quiz_deck(DEFAULT_DECK, count)
 
 @app.get("/settings")
-def get_settings():
-    settings = decrypt_data(SETTINGS_FILE.read_text())
-    return json.loads(settings)
+def get_settings(request: Request):
+    document = load_document(SETTINGS_FILE)
+    return cached_json_response(request, document, lambda: document.data)
 
 @app.post("/settings")
 def update_settings(new_settings: dict):
-    settings = json.loads(decrypt_data(SETTINGS_FILE.read_text()))
-    settings.update(new_settings)
-    SETTINGS_FILE.write_text(encrypt_data(json.dumps(settings, indent=4)))
-    return {"message": "Settings updated successfully"}
+    with document_lock(SETTINGS_FILE):
+        settings = copy.deepcopy(read_json(SETTINGS_FILE))
+        settings.update(new_settings)
+        write_json(SETTINGS_FILE, settings)
+        record_changes([f"setting/{name}" for name in new_settings if name not in LOCAL_SETTINGS])
+        return {"message": "Settings updated successfully"}
+
+# Sync keys are "task/<uid>", "deck/<deck_id>", "card/<deck_id>/<card_id>" and "setting/<name>"
+def assign_record_ids():
+    """
+    Gives tasks and cards stored before they had ids their ids. Sync calls
+    this before locking the journal: assigning ids takes document locks,
+    which must never be taken while the journal lock is held.
+    """
+    tasks_document()
+    for deck_id in load_manifest():
+        if deck_path(deck_id).exists():
+            deck_document(deck_id)
+
+def load_sync_journal() -> dict:
+    if SYNC_FILE.exists():
+        return load_journal()
+
+    # Everything stored before the first sync becomes the initial set of changes
+    journal = new_journal()
+    keys = []
+    if TASKS_FILE.exists():
+        keys.extend(f"task/{task['uid']}" for task in load_tasks()[0])
+    for deck_id in load_manifest():
+        keys.append(f"deck/{deck_id}")
+        if deck_file(deck_id).exists():
+            keys.extend(f"card/{deck_id}/{card['id']}" for card in load_deck(deck_id))
+    if SETTINGS_FILE.exists():
+        keys.extend(f"setting/{name}" for name in read_json(SETTINGS_FILE) if name not in LOCAL_SETTINGS)
+    for key in keys:
+        stamp(journal, key, tick(journal))
+    save_journal(journal)
+    return journal
+
+def record_changes(keys: list[str], deleted: bool = False):
+    with document_lock(SYNC_FILE):
+        # Nothing is journaled before the first sync, which journals everything stored until then
+        if not keys or not SYNC_FILE.exists():
+            return
+        journal = load_journal({shard_name(key) for key in keys})
+        for key in keys:
+            stamp(journal, key, tick(journal), deleted)
+        save_journal(journal)
+
+def sync_record(key: str, loaded: dict):
+    """
+    Returns the current value stored under a sync key, or raises KeyError if
+    the record no longer exists. `loaded` keeps the tasks and deck shards
+    already read for the current batch.
+    """
+    kind, _, name = key.partition("/")
+    if kind == "task":
+        if "tasks" not in loaded:
+            loaded["tasks"] = {task["uid"]: task for task in load_tasks()[0]}
+        return loaded["tasks"][name]
+    if kind == "deck":
+        return {"name": load_manifest()[name]["name"]}
+    if kind == "card":
+        deck_id, card_id = name.split("/")
+        if deck_id not in loaded:
+            loaded[deck_id] = {card["id"]: card for card in load_deck(deck_id)} if deck_id in load_manifest() else {}
+        return loaded[deck_id][card_id]
+    return read_json(SETTINGS_FILE)[name]
+
+def collect_changes(journal: dict, since: int, exclude_node: str | None = None) -> list[dict]:
+    changes = []
+    loaded = {}
+    for key, meta in changes_since(journal, since, exclude_node):
+        change = {"key": key, "hlc": meta["hlc"], "deleted": meta["deleted"]}
+        if not meta["deleted"]:
+            try:
+                change["value"] = sync_record(key, loaded)
+            except KeyError:
+                continue  # Removed without going through the API
+        changes.append(change)
+    return changes
+
+def sync_paths(changes: list[dict]) -> list[Path]:
+    """
+    Returns the storage files that applying `changes` may write, so they can
+    be locked before the journal.
+    """
+    paths = {TASKS_FILE, SETTINGS_FILE, DECKS_MANIFEST}
+    manifest = load_manifest()
+    for change in changes:
+        kind, _, name = change["key"].partition("/")
+        deck_id = name.split("/")[0]
+        # Locking creates a lock file, so only decks that exist or are being created are locked
+        if kind in ("deck", "card") and (deck_id in manifest or (kind == "deck" and not change["deleted"])):
+            paths.add(deck_path(deck_id))
+    return list(paths)
+
+def apply_sync_changes(journal: dict, changes: list[dict]) -> int:
+    """
+    Applies every change that is newer than the local version of its record,
+    so the write with the latest hybrid logical clock timestamp wins on every
+    install. Each storage file is written at most once per batch, and
+    attachment references follow the cards that gain or lose them.
+    """
+    newer = []
+    for change in changes:
+        observe(journal, change["hlc"])
+        local = journal["records"].get(change["key"])
+        if local is None or change["hlc"] > local["hlc"]:
+            newer.append(change)
+
+    applied = []
+    referenced = []
+    released = []
+    # Decks first, so cards arriving in the same batch find their deck
+    manifest = copy.deepcopy(load_manifest())
+    for change in newer:
+        kind, _, deck_id = change["key"].partition("/")
+        if kind != "deck":
+            continue
+        if change["deleted"]:
+            if deck_id in manifest and deck_id != DEFAULT_DECK:
+                if deck_path(deck_id).exists():
+                    released.extend(attachment_ids(load_deck(deck_id)))
+                deck_path(deck_id).unlink(missing_ok=True)
+                discard_lock(deck_path(deck_id))
+                manifest.pop(deck_id)
+        elif deck_id in manifest:
+            manifest[deck_id]["name"] = change["value"]["name"]
+        else:
+            write_json(deck_path(deck_id), [])
+            manifest[deck_id] = {"name": change["value"]["name"], "card_count": 0}
+        applied.append(change)
+    if applied:
+        write_json(DECKS_MANIFEST, manifest)
+
+    tasks = None
+    settings = None
+    decks = {}
+    for change in newer:
+        kind, _, name = change["key"].partition("/")
+        if kind == "task":
+            if tasks is None:
+                tasks = {task["uid"]: task for task in load_tasks()[0]}
+            if change["deleted"]:
+                tasks.pop(name, None)
+            else:
+                tasks[name] = {**change["value"], "uid": name}
+        elif kind == "card":
+            deck_id, card_id = name.split("/")
+            if deck_id not in manifest:
+                continue  # The deck was deleted, which wins over edits to its cards
+            if deck_id not in decks:
+                decks[deck_id] = {card["id"]: card for card in load_deck(deck_id)}
+            previous = decks[deck_id].get(card_id)
+            if change["deleted"]:
+                decks[deck_id].pop(card_id, None)
+            else:
+                decks[deck_id][card_id] = {**change["value"], "id": card_id}
+            current = decks[deck_id].get(card_id)
+            old_ids = set(attachment_ids([previous] if previous else []))
+            new_ids = set(attachment_ids([current] if current else []))
+            referenced.extend(new_ids - old_ids)
+            released.extend(old_ids - new_ids)
+        elif kind == "setting":
+            if settings is None:
+                settings = copy.deepcopy(read_json(SETTINGS_FILE))
+            if change["deleted"]:
+                settings.pop(name, None)
+            else:
+                settings[name] = change["value"]
+        else:
+            continue
+        applied.append(change)
+
+    if tasks is not None:
+        write_json(TASKS_FILE, list(tasks.values()))
+    for deck_id, cards in decks.items():
+        save_deck(deck_id, list(cards.values()))
+    if settings is not None:
+        write_json(SETTINGS_FILE, settings)
+    # References are taken before any are dropped, so content moving between cards survives
+    add_refs(referenced)
+    release(released)
+
+    for change in applied:
+        stamp(journal, change["key"], change["hlc"], change["deleted"])
+    return len(applied)
+
+@app.get("/sync/pull")
+def pull_changes(since: int = 0, node: Optional[str] = None):
+    """
+    Returns the changes journaled after sequence number `since` as a
+    compressed, encrypted batch, leaving out versions that came from `node`.
+    """
+    assign_record_ids()
+    with document_lock(SYNC_FILE):
+        journal = load_sync_journal()
+        batch = {"node": journal["node"], "cursor": journal["seq"], "changes": collect_changes(journal, since, node)}
+    return Response(content=encode_batch(batch), media_type="application/octet-stream")
+
+@app.post("/sync/push")
+def push_changes(batch: bytes = Body(..., media_type="application/octet-stream")):
+    changes = decode_batch(batch, SYNC_SCHEMAS)["changes"]
+    assign_record_ids()
+    with document_lock(*sync_paths(changes)), document_lock(SYNC_FILE):
+        journal = load_sync_journal()
+        applied = apply_sync_changes(journal, changes)
+        save_journal(journal)
+    return {"message": "Changes applied successfully", "applied": applied}
+
+@app.post("/sync/run")
+def run_sync(request: SyncRequest):
+    """
+    Pulls the peer's changes since the last sync with it, then pushes the
+    local changes it has not seen yet.
+    """
+    new_peer = {"node": None, "pulled": 0, "pushed": 0}
+    assign_record_ids()
+    # No lock is held while waiting on the peer, which may be syncing with us
+    with document_lock(SYNC_FILE):
+        journal = load_sync_journal()
+        peer = journal["peers"].get(request.peer, new_peer)
+    try:
+        with httpx.Client(base_url=request.peer, timeout=30) as client:
+            response = client.get("/sync/pull", params={"since": peer["pulled"], "node": journal["node"]})
+            response.raise_for_status()
+            batch = decode_batch(response.content, SYNC_SCHEMAS)
+            with document_lock(*sync_paths(batch["changes"])), document_lock(SYNC_FILE):
+                journal = load_sync_journal()
+                pulled = apply_sync_changes(journal, batch["changes"])
+                peer = journal["peers"].setdefault(request.peer, new_peer)
+                peer.update(node=batch["node"], pulled=batch["cursor"])
+                save_journal(journal)
+                cursor = journal["seq"]
+                outgoing = collect_changes(journal, peer["pushed"], peer["node"])
 
+            if outgoing:
+                response = client.post(
+                    "/sync/push",
+                    content=encode_batch({"node": journal["node"], "cursor": cursor, "changes": outgoing}),
+                    headers={"Content-Type": "application/octet-stream"},
+                )
+                response.raise_for_status()
+            with document_lock(SYNC_FILE):
+                journal = load_sync_journal()
+                peer = journal["peers"][request.peer]
+                peer["pushed"] = max(peer["pushed"], cursor)
+                save_journal(journal)
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail="Sync peer is unreachable or rejected the batch")
+    return {"message": "Sync completed", "pulled": pulled, "pushed": len(outgoing)}
@@ -0,0 +1,77 @@
+import json
+import os
+from hashlib import sha256
+from pathlib import Path
+from uuid import uuid4
+from utils import encrypt_data, decrypt_data
+
+
+class CachedDocument:
+    """
+    Decrypted contents of one storage file plus any structures derived from it
+    (indexes, pre-serialized responses). Valid for as long as the file on disk
+    still has the same signature. `version` is a hash of the encrypted file, so
+    it changes with every write and is the same in every process.
+    """
+
+    def __init__(self, signature: tuple, version: str, data):
+        self.signature = signature
+        self.version = version
+        self.data = data
+        self.derived = {}
+
+
+_documents: dict[Path, CachedDocument] = {}
+
+
+def _signature(path: Path) -> tuple:
+    stat = path.stat()
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _version(encrypted: str) -> str:
+    return sha256(encrypted.encode()).hexdigest()[:32]
+
+
+def load_document(path: Path) -> CachedDocument:
+    """
+    Returns the cached document for `path`, decrypting the file again only if
+    it was changed on disk since it was last read or written through here.
+    """
+    signature = _signature(path)
+    document = _documents.get(path)
+    if document is None or document.signature != signature:
+        encrypted = path.read_text()
+        document = CachedDocument(signature, _version(encrypted), json.loads(decrypt_data(encrypted)))
+        _documents[path] = document
+    return document
+
+
+def read_json(path: Path):
+    """
+    Returns the cached contents of `path`. They are shared with every other
+    reader, so callers that change them must work on a copy.
+    """
+    return load_document(path).data
+
+
+def write_json(path: Path, data, derived: dict | None = None) -> CachedDocument:
+    """
+    Encrypts and atomically replaces `path` with `data`, then caches the new
+    contents so the next read does not have to decrypt them again. Structures
+    the caller kept up to date alongside the write can be passed as `derived`;
+    anything else derived from the old contents is dropped.
+    """
+    temp_path = path.with_name(f"{path.name}.{uuid4().hex}.tmp")
+    encrypted = encrypt_data(json.dumps(data, indent=4))
+    try:
+        temp_path.write_text(encrypted)
+        os.replace(temp_path, path)
+    except OSError:
+        _documents.pop(path, None)
+        temp_path.unlink(missing_ok=True)
+        raise
+    document = CachedDocument(_signature(path), _version(encrypted), data)
+    document.derived.update(derived or {})
+    _documents[path] = document
+    return document
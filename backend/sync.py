@@ -0,0 +1,199 @@
+import copy
+import json
+import os
+import re
+import time
+import zlib
+from uuid import uuid4
+from cryptography.fernet import Fernet, InvalidToken
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from blob_store import is_blob_id
+from store import read_json, write_json
+from utils import STORAGE_DIR
+
+# The journal head: node id, clock, sequence number and peer cursors
+SYNC_FILE = STORAGE_DIR / "sync.json"
+# Journal records, sharded like the storage files they describe
+SYNC_DIR = STORAGE_DIR / "sync"
+
+HEAD_FIELDS = ("node", "clock", "seq", "peers")
+
+# Records are named by hex ids, and the default deck by name, so a key
+# received from a peer can never address any other storage file
+_ID = r"[0-9a-f]{32}"
+_DECK_ID = rf"(?:{_ID}|default)"
+SYNC_KEY = re.compile(rf"task/{_ID}|deck/{_DECK_ID}|card/{_DECK_ID}/{_ID}|setting/.+")
+HLC = re.compile(rf"\d{{15}}:\d{{6}}:{_ID}")
+
+# Settings that describe this install and are never synced
+LOCAL_SETTINGS = {"storage_path"}
+
+
+def new_journal() -> dict:
+    """
+    The journal holds sync metadata only: for every record key the hybrid
+    logical clock timestamp of its latest version, whether that version is a
+    deletion and the local sequence number it was journaled under. Record
+    values stay in the regular storage files. `changed` collects the keys
+    stamped since the journal was loaded.
+    """
+    return {"node": uuid4().hex, "clock": [0, 0], "seq": 0, "records": {}, "peers": {}, "changed": set()}
+
+
+def shard_name(key: str) -> str:
+    kind, _, name = key.partition("/")
+    if kind == "card":
+        return f"cards-{name.split('/')[0]}"
+    return {"task": "tasks", "deck": "decks", "setting": "settings"}[kind]
+
+
+def load_journal(shards: set[str] | None = None) -> dict:
+    """
+    Loads the journal head with the records of the named shards, or of all
+    shards when `shards` is None.
+    """
+    # The cached head is shared with other readers, and callers change it
+    journal = copy.deepcopy(read_json(SYNC_FILE))
+    journal["changed"] = set()
+    if "records" in journal:
+        # Journals written before records were sharded are split on the next save
+        journal["changed"].update(journal["records"])
+        return journal
+    journal["records"] = {}
+    paths = SYNC_DIR.glob("*.json") if shards is None else (SYNC_DIR / f"{name}.json" for name in shards)
+    for path in paths:
+        if path.exists():
+            journal["records"].update(read_json(path))
+    return journal
+
+
+def save_journal(journal: dict):
+    """
+    Writes the journal head and the shards holding changed records, so a
+    write costs as much as the shard it touches rather than the whole library.
+    """
+    by_shard: dict[str, dict] = {}
+    for key in journal["changed"]:
+        by_shard.setdefault(shard_name(key), {})[key] = journal["records"][key]
+    SYNC_DIR.mkdir(exist_ok=True)
+    for name, records in by_shard.items():
+        path = SYNC_DIR / f"{name}.json"
+        write_json(path, {**(read_json(path) if path.exists() else {}), **records})
+    for key in journal["changed"]:
+        kind, _, deck_id = key.partition("/")
+        if kind == "deck" and journal["records"][key]["deleted"]:
+            # Deleting a deck wins over every version of its cards
+            (SYNC_DIR / f"cards-{deck_id}.json").unlink(missing_ok=True)
+    journal["changed"].clear()
+    # The head goes last: a sequence number is only handed out once its records are saved
+    write_json(SYNC_FILE, {field: journal[field] for field in HEAD_FIELDS})
+
+
+def tick(journal: dict) -> str:
+    """
+    Advances the hybrid logical clock for a local write. Timestamps are
+    "<wall ms>:<counter>:<node>" strings that sort in causal order with the
+    node id as a deterministic tie-breaker.
+    """
+    wall = int(time.time() * 1000)
+    last_wall, counter = journal["clock"]
+    if wall > last_wall:
+        last_wall, counter = wall, 0
+    else:
+        counter += 1
+    journal["clock"] = [last_wall, counter]
+    return f"{last_wall:015d}:{counter:06d}:{journal['node']}"
+
+
+def observe(journal: dict, hlc: str):
+    """
+    Moves the clock past a timestamp received from another node, so later
+    local writes always win over the versions they overwrite.
+    """
+    wall, counter, _ = hlc.split(":")
+    journal["clock"] = max(journal["clock"], [int(wall), int(counter)])
+
+
+def origin(hlc: str) -> str:
+    return hlc.rsplit(":", 1)[1]
+
+
+def stamp(journal: dict, key: str, hlc: str, deleted: bool = False):
+    journal["seq"] += 1
+    journal["records"][key] = {"hlc": hlc, "deleted": deleted, "seq": journal["seq"]}
+    journal["changed"].add(key)
+
+
+def changes_since(journal: dict, since: int, exclude_node: str | None = None) -> list[tuple[str, dict]]:
+    """
+    Returns the journal entries added after local sequence number `since`,
+    skipping versions that originally came from `exclude_node`.
+    """
+    return sorted(
+        (
+            (key, meta)
+            for key, meta in journal["records"].items()
+            if meta["seq"] > since and origin(meta["hlc"]) != exclude_node
+        ),
+        key=lambda change: change[1]["seq"],
+    )
+
+
+def get_sync_cipher() -> Fernet:
+    # Installs each have their own storage key, so batches use a key shared between them
+    key = os.getenv("STUDYHELPER_SYNC_KEY")
+    if not key:
+        raise HTTPException(status_code=400, detail="Sync key not configured")
+    return Fernet(key)
+
+
+def encode_batch(batch: dict) -> bytes:
+    return get_sync_cipher().encrypt(zlib.compress(json.dumps(batch).encode()))
+
+
+def valid_change(change, schemas: dict[str, type[BaseModel]]) -> bool:
+    if not isinstance(change, dict) or not isinstance(change.get("deleted"), bool):
+        return False
+    if not isinstance(change.get("key"), str) or not SYNC_KEY.fullmatch(change["key"]):
+        return False
+    if not isinstance(change.get("hlc"), str) or not HLC.fullmatch(change["hlc"]):
+        return False
+    kind, _, name = change["key"].partition("/")
+    if kind == "setting":
+        return name not in LOCAL_SETTINGS and (change["deleted"] or "value" in change)
+    if change["deleted"]:
+        return True
+    value = change.get("value")
+    if not isinstance(value, dict):
+        return False
+    try:
+        schemas[kind].model_validate(value)
+    except ValidationError:
+        return False
+    attachments = value.get("attachments", []) if kind == "card" else []
+    return isinstance(attachments, list) and all(
+        isinstance(attachment, dict) and isinstance(attachment.get("id"), str) and is_blob_id(attachment["id"])
+        for attachment in attachments
+    )
+
+
+def decode_batch(data: bytes, schemas: dict[str, type[BaseModel]]) -> dict:
+    """
+    Decrypts a batch from a peer and checks every change in it before any of
+    it is applied. Record values must validate against the model in `schemas`
+    for their kind ("task", "deck" or "card").
+    """
+    try:
+        batch = json.loads(zlib.decompress(get_sync_cipher().decrypt(data)))
+    except (InvalidToken, zlib.error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid sync batch")
+    if (
+        not isinstance(batch, dict)
+        or not isinstance(batch.get("node"), str)
+        or not isinstance(batch.get("cursor"), int)
+        or not isinstance(batch.get("changes"), list)
+        or not all(valid_change(change, schemas) for change in batch["changes"])
+    ):
+        raise HTTPException(status_code=400, detail="Invalid sync batch")
+    return batch
@@ -0,0 +1,67 @@
+from bisect import bisect_left, bisect_right, insort
+
+
+class TaskIndex:
+    """
+    Secondary indexes over the task list, keyed by task position:
+    hash indexes on status and tag, and a list of (due_date, task_id)
+    pairs kept sorted so date ranges can be answered with a binary search.
+    """
+
+    def __init__(self, tasks: list[dict]):
+        self.size = 0
+        self.by_status: dict[str, set[int]] = {}
+        self.by_tag: dict[str, set[int]] = {}
+        self.by_due: list[tuple[str, int]] = []
+        for task in tasks:
+            self.add(self.size, task)
+
+    def add(self, task_id: int, task: dict):
+        self.by_status.setdefault(task.get("status", "todo"), set()).add(task_id)
+        for tag in task.get("tags", []):
+            self.by_tag.setdefault(tag, set()).add(task_id)
+        if task.get("due_date"):
+            insort(self.by_due, (task["due_date"], task_id))
+        self.size = max(self.size, task_id + 1)
+
+    def copy(self) -> "TaskIndex":
+        index = TaskIndex([])
+        index.size = self.size
+        index.by_status = {status: set(task_ids) for status, task_ids in self.by_status.items()}
+        index.by_tag = {tag: set(task_ids) for tag, task_ids in self.by_tag.items()}
+        index.by_due = list(self.by_due)
+        return index
+
+    def remove(self, task_id: int, task: dict):
+        self.by_status.get(task.get("status", "todo"), set()).discard(task_id)
+        for tag in task.get("tags", []):
+            self.by_tag.get(tag, set()).discard(task_id)
+        if task.get("due_date"):
+            self.by_due.remove((task["due_date"], task_id))
+
+    def query(
+        self,
+        status: str | None = None,
+        tag: str | None = None,
+        due_after: str | None = None,
+        due_before: str | None = None,
+    ) -> set[int] | None:
+        """
+        Returns the ids of tasks matching every given filter (dates are ISO
+        strings, both bounds inclusive), or None when no filter was given.
+        """
+        matches = None
+        if status is not None:
+            matches = set(self.by_status.get(status, ()))
+        if tag is not None:
+            tagged = self.by_tag.get(tag, set())
+            matches = set(tagged) if matches is None else matches & tagged
+        if due_after is not None or due_before is not None:
+            dated = {task_id for _, task_id in self.due_range(due_after, due_before)}
+            matches = dated if matches is None else matches & dated
+        return matches
+
+    def due_range(self, due_after: str | None = None, due_before: str | None = None) -> list[tuple[str, int]]:
+        start = 0 if due_after is None else bisect_left(self.by_due, (due_after, -1))
+        end = len(self.by_due) if due_before is None else bisect_right(self.by_due, (due_before, self.size))
+        return self.by_due[start:end]
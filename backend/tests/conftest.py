@@ -8,3 +8,9 @@ load_dotenv()
 backend_path = Path(__file__).resolve().parent.parent
 if str(backend_path) not in sys.path:
     sys.path.insert(0, str(backend_path))
+
+
+def pytest_sessionstart(session):
+    # Files left by an earlier run may be encrypted with a key that was cleaned up since
+    from tests.helpers import cleanup_files
+    cleanup_files()
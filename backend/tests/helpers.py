@@ -1,6 +1,15 @@
+from contextlib import contextmanager
 from pathlib import Path
 from utils import encrypt_data
+import httpx
 import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
 
 # Directory and files to manage
 STORAGE_DIR = Path("storage")
@@ -10,6 +19,7 @@ FILES_TO_CLEANUP = [
     "timer.json",
     "flashcards.json",
     "settings.json",
+    "sync.json",
     "data_export.zip",
     "test_import.zip",
     "encryption_key",
@@ -23,6 +33,16 @@ def cleanup_files():
         file_path = STORAGE_DIR / file_name
         if file_path.exists():
             file_path.unlink()
+    for file_path in (STORAGE_DIR / "decks").glob("*.json"):
+        file_path.unlink()
+    for file_path in [*(STORAGE_DIR / "timer_archive").glob("*.seg"), *(STORAGE_DIR / "timer_archive").glob("compaction.metrics")]:
+        file_path.unlink()
+    for file_path in [*(STORAGE_DIR / "imports").glob("*.job"), *(STORAGE_DIR / "sync").glob("*.json")]:
+        file_path.unlink()
+    for file_path in [*(STORAGE_DIR / "blobs").rglob("*.blob"), *(STORAGE_DIR / "blobs").glob("index.json")]:
+        file_path.unlink()
+    for file_path in (STORAGE_DIR / "locks").glob("*.lock"):
+        file_path.unlink()
 
 def reset_file(file_path: Path, content: dict | list):
     """
@@ -46,3 +66,39 @@ def reset_all_files():
         STORAGE_DIR / "settings.json",
         {"storage_path": str(STORAGE_DIR), "theme": "light", "notifications": True},
     )
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def backend_server(workdir: Path, *args: str, env: dict | None = None, timeout: float = 30):
+    """
+    Runs the backend with uvicorn in `workdir`, passing `args` on to uvicorn,
+    and yields its base URL once it answers. Raises RuntimeError if the
+    server exits or does not answer within `timeout` seconds.
+    """
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), *args],
+        cwd=workdir, env={**os.environ, **(env or {}), "PYTHONPATH": str(BACKEND_DIR)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                httpx.get(url)
+                break
+            except httpx.TransportError:
+                if process.poll() is not None:
+                    raise RuntimeError(f"Backend exited with status {process.returncode} before answering on {url}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Backend did not answer on {url} within {timeout} seconds")
+                time.sleep(0.05)
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
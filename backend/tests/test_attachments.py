@@ -0,0 +1,141 @@
+from main import app, load_index
+from cryptography.fernet import Fernet
+from fastapi.testclient import TestClient
+from pathlib import Path
+from sync import encode_batch
+from tests.helpers import reset_file
+import os
+import time
+import zipfile
+
+client = TestClient(app)
+
+FLASHCARDS_FILE = Path("storage/flashcards.json")
+BLOBS_DIR = Path("storage/blobs")
+EXPORT_FILE = Path("storage/data_export.zip")
+
+
+def upload(url, content, filename="diagram.png"):
+    return client.post(url, files={"file": (filename, content, "image/png")})
+
+
+def test_attachments_are_deduplicated_and_collected():
+    """
+    Test that identical attachments share one blob that is deleted with its last card.
+    """
+    reset_file(FLASHCARDS_FILE, [{"id": "legacy", "question": "Default deck", "answer": "Card"}])
+    deck_id = client.post("/decks", json={"name": "Anatomy"}).json()["id"]
+    card_id = client.post(f"/decks/{deck_id}/flashcards", json={"question": "Heart?", "answer": "Organ"}).json()["id"]
+    image = os.urandom(200_000)
+
+    response = upload(f"/decks/{deck_id}/flashcards/{card_id}/attachments", image)
+    assert response.status_code == 200, "Expected status code 200 for uploading an attachment"
+    attachment_id = response.json()["id"]
+    assert response.json()["size"] == len(image)
+
+    # Attaching the same content to the card again takes no extra reference
+    assert upload(f"/decks/{deck_id}/flashcards/{card_id}/attachments", image).json()["id"] == attachment_id
+    assert len(client.get(f"/decks/{deck_id}/flashcards").json()[0]["attachments"]) == 1
+
+    response = upload("/decks/default/flashcards/legacy/attachments", image, "copy.png")
+    assert response.json()["id"] == attachment_id, "Identical content should map to the same attachment"
+    assert len(list(BLOBS_DIR.rglob("*.blob"))) == 1, "Identical content should be stored once"
+
+    card = client.get(f"/decks/{deck_id}/flashcards").json()[0]
+    assert card["attachments"][0]["name"] == "diagram.png"
+    assert (Path("storage/decks") / f"{deck_id}.json").stat().st_size < 2_000, "Cards should only reference blobs"
+
+    # Editing a card keeps its attachments
+    client.put(f"/decks/{deck_id}/flashcards/{card_id}", json={"question": "Heart?", "answer": "A muscle"})
+    assert len(client.get(f"/decks/{deck_id}/flashcards").json()[0]["attachments"]) == 1
+
+    client.get("/export")
+    with zipfile.ZipFile(EXPORT_FILE, "r") as zipf:
+        assert any(name.endswith(f"{attachment_id}.blob") for name in zipf.namelist())
+
+    assert client.delete(f"/decks/{deck_id}/flashcards/{card_id}").status_code == 200
+    assert client.get(f"/attachments/{attachment_id}").status_code == 200, "Blob is still referenced"
+
+    assert client.delete("/flashcards/0").status_code == 200
+    assert client.get(f"/attachments/{attachment_id}").status_code == 404, "Unreferenced blobs should be collected"
+    assert list(BLOBS_DIR.rglob("*.blob")) == []
+
+    client.delete(f"/decks/{deck_id}")
+
+
+def test_attachment_range_requests():
+    """
+    Test streaming whole attachments, byte ranges and conditional requests.
+    """
+    deck_id = client.post("/decks", json={"name": "Maps"}).json()["id"]
+    card_id = client.post(f"/decks/{deck_id}/flashcards", json={"question": "Where?", "answer": "Here"}).json()["id"]
+    image = os.urandom(150_000)
+    attachment_id = upload(f"/decks/{deck_id}/flashcards/{card_id}/attachments", image).json()["id"]
+    url = f"/attachments/{attachment_id}"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == image
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["accept-ranges"] == "bytes"
+
+    response = client.get(url, headers={"Range": "bytes=65000-131100"})
+    assert response.status_code == 206, "Expected status code 206 for a byte range"
+    assert response.content == image[65000:131101]
+    assert response.headers["content-range"] == f"bytes 65000-131100/{len(image)}"
+
+    response = client.get(url, headers={"Range": "bytes=-100"})
+    assert response.content == image[-100:]
+
+    response = client.get(url, headers={"Range": f"bytes={len(image)}-"})
+    assert response.status_code == 416, "Expected status code 416 for a range past the end"
+
+    response = client.get(url, headers={"If-None-Match": f'"{attachment_id}"'})
+    assert response.status_code == 304
+
+    response = client.delete(f"/decks/{deck_id}/flashcards/{card_id}/attachments/{attachment_id}")
+    assert response.status_code == 200
+    assert client.get(url).status_code == 404
+    assert client.get("/attachments/not-a-hash").status_code == 404
+
+    client.delete(f"/decks/{deck_id}")
+
+
+def test_synced_cards_keep_attachment_references(monkeypatch):
+    """
+    Test that cards and decks changed through sync take and release attachment references.
+    """
+    monkeypatch.setenv("STUDYHELPER_SYNC_KEY", Fernet.generate_key().decode())
+    deck_id = client.post("/decks", json={"name": "Synced"}).json()["id"]
+    card_id = client.post(f"/decks/{deck_id}/flashcards", json={"question": "Lung?", "answer": "Organ"}).json()["id"]
+    blob = upload(f"/decks/{deck_id}/flashcards/{card_id}/attachments", os.urandom(1000)).json()
+    attachment = {key: blob[key] for key in ("id", "size", "content_type")}
+    later = int(time.time() * 1000) + 60_000
+
+    def push(key, value=None, deleted=False):
+        nonlocal later
+        later += 1
+        change = {"key": key, "hlc": f"{later:015d}:000000:{'f' * 32}", "deleted": deleted, "value": value}
+        batch = encode_batch({"node": "f" * 32, "cursor": 1, "changes": [change]})
+        response = client.post("/sync/push", content=batch, headers={"Content-Type": "application/octet-stream"})
+        assert response.json()["applied"] == 1
+
+    # Another install's card reuses content stored here
+    other_id = "e" * 32
+    push(f"card/{deck_id}/{other_id}", {"question": "Also?", "answer": "Same", "tags": [], "attachments": [attachment]})
+    assert load_index()[blob["id"]]["refs"] == 2
+
+    # A synced edit dropping the attachment releases only that card's reference
+    push(f"card/{deck_id}/{card_id}", {"question": "Lung?", "answer": "Organ", "tags": []})
+    assert load_index()[blob["id"]]["refs"] == 1
+    assert client.get(f"/attachments/{blob['id']}").status_code == 200
+
+    # Content not stored here yet is counted but not served
+    missing = {"id": "d" * 64, "size": 10, "content_type": "image/png"}
+    push(f"card/{deck_id}/{card_id}", {"question": "Lung?", "answer": "Organ", "tags": [], "attachments": [missing]})
+    assert client.get(f"/attachments/{'d' * 64}").status_code == 404
+
+    # Deleting the deck through sync releases its cards' references
+    push(f"deck/{deck_id}", deleted=True)
+    assert blob["id"] not in load_index() and "d" * 64 not in load_index()
+    assert client.get(f"/attachments/{blob['id']}").status_code == 404
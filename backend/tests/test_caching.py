@@ -0,0 +1,79 @@
+import main
+from main import app
+from fastapi.testclient import TestClient
+from pathlib import Path
+from tests.helpers import reset_all_files, reset_file
+
+client = TestClient(app)
+
+TASKS_FILE = Path("storage/tasks.json")
+
+
+def test_conditional_get_returns_not_modified():
+    """
+    Test that read endpoints serve ETags and answer matching If-None-Match with 304.
+    """
+    reset_all_files()
+    for path in ("/tasks", "/flashcards", "/settings", "/progress"):
+        response = client.get(path)
+        assert response.status_code == 200, f"Expected status code 200 for GET {path}"
+        etag = response.headers["etag"]
+        assert etag.startswith('"') and etag.endswith('"'), "Expected a strong ETag"
+
+        response = client.get(path, headers={"If-None-Match": etag})
+        assert response.status_code == 304, f"Expected status code 304 for unchanged {path}"
+        assert response.content == b""
+
+        response = client.get(path, headers={"If-None-Match": '"stale", W/' + etag})
+        assert response.status_code == 304, "Any matching entity tag should produce a 304"
+
+
+def test_etag_changes_with_content():
+    """
+    Test that writes, external file changes and query parameters all change the ETag.
+    """
+    reset_file(TASKS_FILE, [])
+    etag = client.get("/tasks").headers["etag"]
+    assert client.get("/tasks").headers["etag"] == etag, "ETag should be stable for unchanged data"
+
+    client.post("/tasks", json={"title": "Essay", "description": "Draft", "tags": ["english"]})
+    response = client.get("/tasks", headers={"If-None-Match": etag})
+    assert response.status_code == 200, "A write should invalidate the previous ETag"
+    assert response.json()[0]["title"] == "Essay"
+    etag = response.headers["etag"]
+
+    filtered = client.get("/tasks", params={"tag": "english"})
+    assert filtered.headers["etag"] != etag, "Filtered views need their own ETag"
+    assert client.get("/tasks", params={"tag": "english"}, headers={"If-None-Match": filtered.headers["etag"]}).status_code == 304
+
+    reset_file(TASKS_FILE, [{"title": "Replaced", "description": "Outside the API"}])
+    response = client.get("/tasks", headers={"If-None-Match": etag})
+    assert response.status_code == 200, "Changing the file on disk should invalidate the ETag"
+    assert response.json()[0]["title"] == "Replaced"
+
+
+def test_body_and_etag_come_from_one_version(monkeypatch):
+    """
+    Test that a file replaced by another worker during a read is not cached under the new version.
+    """
+    first_task = {"uid": "a" * 32, "title": "First", "description": "Old"}
+    reset_file(TASKS_FILE, [first_task])
+    load_document = main.load_document
+    replaced = []
+
+    def load_then_replace(path):
+        document = load_document(path)
+        if path == TASKS_FILE and not replaced:
+            # Another worker writes right after this one loaded the file
+            replaced.append(path)
+            reset_file(TASKS_FILE, [first_task, {"uid": "b" * 32, "title": "Second", "description": "New"}])
+        return document
+
+    monkeypatch.setattr(main, "load_document", load_then_replace)
+    first = client.get("/tasks")
+    monkeypatch.undo()
+    assert len(first.json()) == 1
+
+    second = client.get("/tasks")
+    assert len(second.json()) == 2, "The body cached for the new version should have its tasks"
+    assert second.headers["etag"] != first.headers["etag"]
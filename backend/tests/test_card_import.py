@@ -0,0 +1,125 @@
+from main import app
+from fastapi.testclient import TestClient
+from pathlib import Path
+from utils import encrypt_data
+import json
+import time
+
+client = TestClient(app)
+FLASHCARDS_FILE = Path("storage/flashcards.json")
+
+
+def import_file(deck_id, name, content, **params):
+    response = client.post(
+        f"/decks/{deck_id}/import",
+        files={"file": (name, content.encode(), "text/plain")},
+        params=params,
+    )
+    assert response.status_code == 200, "Expected status code 200 for starting an import"
+    return client.get(f"/imports/{response.json()['import_id']}").json()
+
+
+def test_import_csv_with_duplicates_and_invalid_rows():
+    """
+    Test importing a CSV file, skipping duplicates and reporting invalid rows.
+    """
+    deck_id = client.post("/decks", json={"name": "Capitals"}).json()["id"]
+    client.post(f"/decks/{deck_id}/flashcards", json={"question": "Capital of France?", "answer": "Paris"})
+
+    content = (
+        "question,answer,tags\n"
+        "Capital of Spain?,Madrid,europe\n"
+        "\"Capital of Japan, Asia?\",Tokyo,asia island\n"
+        "capital of france?,  PARIS ,europe\n"
+        "Capital of Spain?,Madrid,\n"
+        "Missing answer\n"
+        ",Empty question\n"
+    )
+    progress = import_file(deck_id, "capitals.csv", content)
+    assert progress["status"] == "completed"
+    assert progress["imported"] == 2
+    assert progress["duplicates"] == 2, "Cards already in the deck or the file should be skipped"
+    assert progress["invalid"] == 2
+    assert [error["line"] for error in progress["errors"]] == [6, 7]
+
+    cards = client.get(f"/decks/{deck_id}/flashcards").json()
+    assert [card["question"] for card in cards] == ["Capital of France?", "Capital of Spain?", "Capital of Japan, Asia?"]
+    assert cards[2]["tags"] == ["asia", "island"]
+
+    client.delete(f"/decks/{deck_id}")
+
+
+def test_import_anki_text_export():
+    """
+    Test importing an Anki text export with header lines and HTML fields.
+    """
+    deck_id = client.post("/decks", json={"name": "Anki"}).json()["id"]
+    content = (
+        "#separator:Semicolon\n"
+        "#html:true\n"
+        "#tags column:3\n"
+        "<b>Mitochondria</b>;Powerhouse<br>of the cell;biology\n"
+        "H&lt;sub&gt;2&lt;/sub&gt;O;Water;chemistry\n"
+    )
+    progress = import_file(deck_id, "anki.txt", content)
+    assert progress["imported"] == 2
+
+    cards = client.get(f"/decks/{deck_id}/flashcards").json()
+    assert cards[0]["question"] == "Mitochondria"
+    assert cards[0]["answer"] == "Powerhouse\nof the cell"
+    assert cards[0]["tags"] == ["biology"]
+
+    client.delete(f"/decks/{deck_id}")
+
+
+def test_import_large_deck_in_batches():
+    """
+    Test that a large TSV import commits in batches and finishes quickly.
+    """
+    deck_id = client.post("/decks", json={"name": "Vocabulary"}).json()["id"]
+    content = "".join(f"word {number}\tmeaning {number}\n" for number in range(5000))
+
+    started = time.perf_counter()
+    progress = import_file(deck_id, "words.tsv", content)
+    assert time.perf_counter() - started < 10, "Importing 5000 cards should take seconds"
+    assert progress["imported"] == 5000
+    assert progress["batches"] == 4, "Batches should grow with the deck: 1000, 1000, 2000 and the last 1000"
+
+    decks = {deck["id"]: deck for deck in client.get("/decks").json()}
+    assert decks[deck_id]["card_count"] == 5000
+
+    # Importing the same file again only finds duplicates
+    progress = import_file(deck_id, "words.tsv", content)
+    assert progress["imported"] == 0 and progress["duplicates"] == 5000
+
+    client.delete(f"/decks/{deck_id}")
+    assert client.get("/imports/missing").status_code == 404
+    assert client.post("/decks/missing/import", files={"file": ("x.csv", b"a,b", "text/csv")}).status_code == 404
+
+
+def test_import_with_malformed_anki_headers_fails():
+    """
+    Test that unusable Anki header values mark the import failed instead of leaving it running.
+    """
+    deck_id = client.post("/decks", json={"name": "Broken"}).json()["id"]
+    for header in ("#tags column:x", "#separator:", "#separator:Wavy"):
+        progress = import_file(deck_id, "anki.txt", f"{header}\nQuestion;Answer\n")
+        assert progress["status"] == "failed", f"Expected a failed import for {header!r}"
+        assert progress["errors"][0]["line"] is None
+
+    assert client.get(f"/decks/{deck_id}/flashcards").json() == []
+    client.delete(f"/decks/{deck_id}")
+
+
+def test_import_into_deck_with_legacy_cards():
+    """
+    Test importing into a deck whose stored cards lack a question or answer.
+    """
+    FLASHCARDS_FILE.write_text(encrypt_data(json.dumps([{"question": "Only a question"}, {"answer": "Only an answer"}])))
+
+    progress = import_file("default", "cards.csv", "question,answer\nOnly a question,Now answered\n")
+    assert progress["status"] == "completed"
+    assert progress["imported"] == 1
+
+    assert len(client.get("/flashcards").json()) == 3
+    FLASHCARDS_FILE.write_text(encrypt_data(json.dumps([])))
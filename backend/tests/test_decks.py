@@ -0,0 +1,119 @@
+from main import app
+from fastapi.testclient import TestClient
+from pathlib import Path
+from tests.helpers import reset_file
+
+client = TestClient(app)
+
+FLASHCARDS_FILE = Path("storage/flashcards.json")
+DECKS_DIR = Path("storage/decks")
+LOCKS_DIR = Path("storage/locks")
+
+
+def test_deck_lifecycle():
+    """
+    Test creating a deck, managing its cards by id and deleting it.
+    """
+    response = client.post("/decks", json={"name": "Biology"})
+    assert response.status_code == 200, "Expected status code 200 for POST /decks"
+    deck_id = response.json()["id"]
+    assert (DECKS_DIR / f"{deck_id}.json").exists(), "Each deck should get its own shard"
+
+    decks = {deck["id"]: deck for deck in client.get("/decks").json()}
+    assert decks[deck_id] == {"id": deck_id, "name": "Biology", "card_count": 0}
+    assert "default" in decks, "The default deck should always be listed"
+
+    card = {"question": "What is a cell?", "answer": "The basic unit of life"}
+    response = client.post(f"/decks/{deck_id}/flashcards", json=card)
+    assert response.status_code == 200
+    card_id = response.json()["id"]
+
+    cards = client.get(f"/decks/{deck_id}/flashcards").json()
+    assert cards == [{"id": card_id, "tags": [], **card}]
+
+    response = client.put(
+        f"/decks/{deck_id}/flashcards/{card_id}",
+        json={"question": "What is a cell?", "answer": "A unit of life", "tags": ["intro"]},
+    )
+    assert response.status_code == 200
+    assert client.get(f"/decks/{deck_id}/quiz", params={"count": 3}).json()[0]["answer"] == "A unit of life"
+
+    export = client.get(f"/decks/{deck_id}/export").json()
+    assert export["name"] == "Biology"
+    assert len(export["flashcards"]) == 1
+
+    decks = {deck["id"]: deck for deck in client.get("/decks").json()}
+    assert decks[deck_id]["card_count"] == 1, "Manifest card count should follow writes"
+
+    response = client.delete(f"/decks/{deck_id}/flashcards/{card_id}")
+    assert response.status_code == 200
+    response = client.delete(f"/decks/{deck_id}/flashcards/{card_id}")
+    assert response.status_code == 404, "Expected status code 404 for a deleted card"
+    assert client.get(f"/decks/{deck_id}/quiz").status_code == 404
+
+    response = client.delete(f"/decks/{deck_id}")
+    assert response.status_code == 200
+    assert not (DECKS_DIR / f"{deck_id}.json").exists(), "Deleting a deck should remove its shard"
+    assert client.get(f"/decks/{deck_id}/flashcards").status_code == 404
+
+
+def test_deck_writes_are_isolated():
+    """
+    Test that editing one deck leaves other deck shards untouched.
+    """
+    first = client.post("/decks", json={"name": "First"}).json()["id"]
+    second = client.post("/decks", json={"name": "Second"}).json()["id"]
+    client.post(f"/decks/{second}/flashcards", json={"question": "Q", "answer": "A"})
+    second_shard = (DECKS_DIR / f"{second}.json").read_text()
+
+    client.post(f"/decks/{first}/flashcards", json={"question": "Q1", "answer": "A1"})
+    assert (DECKS_DIR / f"{second}.json").read_text() == second_shard
+
+    client.delete(f"/decks/{first}")
+    client.delete(f"/decks/{second}")
+
+
+def test_invalid_deck_requests():
+    """
+    Test validation of decks and flashcards and protection of the default deck.
+    """
+    assert client.post("/decks", json={"name": ""}).status_code == 422
+    assert client.delete("/decks/default").status_code == 400
+    assert client.get("/decks/missing/flashcards").status_code == 404
+    assert client.put("/decks/missing", json={"name": "Missing"}).status_code == 404
+
+    reset_file(FLASHCARDS_FILE, [])
+    response = client.post("/flashcards", json={"question": "No answer"})
+    assert response.status_code == 422, "Expected status code 422 for a flashcard without an answer"
+    response = client.post("/decks/default/flashcards", json={"question": "", "answer": "Empty"})
+    assert response.status_code == 422, "Expected status code 422 for an empty question"
+
+
+def test_legacy_cards_get_ids():
+    """
+    Test that cards stored without ids are addressable through the default deck.
+    """
+    reset_file(FLASHCARDS_FILE, [{"question": "Old", "answer": "Card"}])
+    cards = client.get("/decks/default/flashcards").json()
+    assert len(cards) == 1 and cards[0]["id"], "Legacy cards should be given an id"
+
+    response = client.delete(f"/decks/default/flashcards/{cards[0]['id']}")
+    assert response.status_code == 200
+    assert client.get("/flashcards").json() == []
+
+
+def test_deck_lock_files_are_cleaned_up():
+    """
+    Test that unknown decks get no lock file and deleted decks leave none behind.
+    """
+    missing = "0" * 32
+    response = client.post(f"/decks/{missing}/flashcards", json={"question": "Q?", "answer": "A"})
+    assert response.status_code == 404
+    assert not any(missing in path.name for path in LOCKS_DIR.glob("*.lock")), "Unknown decks should not be locked"
+
+    deck_id = client.post("/decks", json={"name": "Temporary"}).json()["id"]
+    client.post(f"/decks/{deck_id}/flashcards", json={"question": "Q?", "answer": "A"})
+    assert any(deck_id in path.name for path in LOCKS_DIR.glob("*.lock"))
+
+    client.delete(f"/decks/{deck_id}")
+    assert not any(deck_id in path.name for path in LOCKS_DIR.glob("*.lock")), "Deleting a deck should remove its lock file"
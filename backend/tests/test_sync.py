@@ -0,0 +1,171 @@
+from contextlib import ExitStack
+from cryptography.fernet import Fernet
+from tests.helpers import backend_server
+import httpx
+import json
+import pytest
+import time
+import zlib
+
+SYNC_KEY = Fernet.generate_key().decode()
+
+
+@pytest.fixture
+def installs(tmp_path):
+    """
+    Starts two independent backend instances on localhost, each with its own
+    storage directory and encryption key but a shared sync key.
+    """
+    with ExitStack() as stack:
+        urls = []
+        for name in ("laptop", "desktop"):
+            workdir = tmp_path / name
+            workdir.mkdir()
+            urls.append(stack.enter_context(backend_server(workdir, env={"STUDYHELPER_SYNC_KEY": SYNC_KEY})))
+        clients = [stack.enter_context(httpx.Client(base_url=url)) for url in urls]
+        yield clients, urls
+
+
+def pull(client, since=0):
+    batch = client.get("/sync/pull", params={"since": since}).content
+    return json.loads(zlib.decompress(Fernet(SYNC_KEY).decrypt(batch)))
+
+
+def push(client, changes):
+    batch = Fernet(SYNC_KEY).encrypt(zlib.compress(json.dumps({"node": "f" * 32, "cursor": 1, "changes": changes}).encode()))
+    return client.post("/sync/push", content=batch, headers={"Content-Type": "application/octet-stream"})
+
+
+def test_sync_between_installs(installs):
+    """
+    Test that changes flow both ways and only changed records are shipped.
+    """
+    (laptop, desktop), (laptop_url, desktop_url) = installs
+
+    laptop.post("/tasks", json={"title": "Essay", "description": "Draft"})
+    deck_id = laptop.post("/decks", json={"name": "Biology"}).json()["id"]
+    laptop.post(f"/decks/{deck_id}/flashcards", json={"question": "Cell?", "answer": "Unit of life"})
+    laptop.post("/settings", json={"theme": "dark"})
+    desktop.post("/tasks", json={"title": "Reading", "description": "Chapter 1"})
+
+    response = laptop.post("/sync/run", json={"peer": desktop_url})
+    assert response.status_code == 200, "Expected status code 200 for POST /sync/run"
+
+    for client in (laptop, desktop):
+        assert sorted(task["title"] for task in client.get("/tasks").json()) == ["Essay", "Reading"]
+        assert client.get(f"/decks/{deck_id}/flashcards").json()[0]["question"] == "Cell?"
+        assert client.get("/settings").json()["theme"] == "dark"
+    assert desktop.get("/settings").json()["storage_path"] == "storage", "Local settings are not synced"
+
+    # A second sync with nothing new transfers nothing
+    response = laptop.post("/sync/run", json={"peer": desktop_url}).json()
+    assert (response["pulled"], response["pushed"]) == (0, 0)
+
+    # Pulling since a cursor only ships records changed after it
+    cursor = pull(desktop)["cursor"]
+    desktop.delete("/tasks/0")
+    changes = pull(desktop, since=cursor)["changes"]
+    assert len(changes) == 1 and changes[0]["deleted"], "Expected only the deleted task in the batch"
+
+
+def test_sync_conflicts_resolve_deterministically(installs):
+    """
+    Test that concurrent edits of the same record end with the latest write on both installs.
+    """
+    (laptop, desktop), (laptop_url, desktop_url) = installs
+
+    laptop.post("/tasks", json={"title": "Essay", "description": "Draft"})
+    desktop.post("/sync/run", json={"peer": laptop_url})
+    assert desktop.get("/tasks").json()[0]["title"] == "Essay"
+
+    laptop.put("/tasks/0", json={"title": "Essay", "description": "Laptop edit"})
+    time.sleep(0.01)
+    desktop.put("/tasks/0", json={"title": "Essay", "description": "Desktop edit", "status": "done"})
+
+    desktop.post("/sync/run", json={"peer": laptop_url})
+    for client in (laptop, desktop):
+        tasks = client.get("/tasks").json()
+        assert len(tasks) == 1
+        assert tasks[0]["description"] == "Desktop edit"
+
+    # Deletions propagate and win over older edits
+    laptop.delete("/tasks/0")
+    laptop.post("/sync/run", json={"peer": desktop_url})
+    assert desktop.get("/tasks").json() == []
+
+    response = desktop.post("/sync/push", content=b"not a batch", headers={"Content-Type": "application/octet-stream"})
+    assert response.status_code == 400, "Expected status code 400 for a batch not encrypted with the sync key"
+
+
+def test_journal_is_created_on_first_sync_and_written_per_shard(installs, tmp_path):
+    """
+    Test that nothing is journaled before the first sync and that a change
+    rewrites only the journal shard of the deck it belongs to.
+    """
+    (laptop, desktop), (laptop_url, desktop_url) = installs
+    storage = tmp_path / "laptop" / "storage"
+
+    biology = laptop.post("/decks", json={"name": "Biology"}).json()["id"]
+    history = laptop.post("/decks", json={"name": "History"}).json()["id"]
+    laptop.post(f"/decks/{history}/flashcards", json={"question": "1066?", "answer": "Hastings"})
+    assert not (storage / "sync.json").exists(), "The journal should not exist before the first sync"
+
+    laptop.post("/sync/run", json={"peer": desktop_url})
+    assert (storage / "sync" / f"cards-{history}.json").exists()
+    shards = {path.name: path.stat().st_mtime_ns for path in (storage / "sync").glob("*.json")}
+
+    laptop.post(f"/decks/{biology}/flashcards", json={"question": "Cell?", "answer": "Unit of life"})
+    changed = {path.name for path in (storage / "sync").glob("*.json") if shards.get(path.name) != path.stat().st_mtime_ns}
+    assert changed == {f"cards-{biology}.json"}, "Only the changed deck's journal shard should be written"
+
+    laptop.post("/sync/run", json={"peer": desktop_url})
+    assert desktop.get(f"/decks/{biology}/flashcards").json()[0]["question"] == "Cell?"
+
+    laptop.delete(f"/decks/{history}")
+    assert not (storage / "sync" / f"cards-{history}.json").exists()
+
+
+def test_push_rejects_invalid_keys(installs):
+    """
+    Test that changes whose keys could address other storage files are rejected.
+    """
+    (laptop, _), _ = installs
+    laptop.post("/tasks", json={"title": "Essay", "description": "Draft"})
+    hlc = f"{int(time.time() * 1000) + 60000:015d}:000000:{'f' * 32}"
+
+    for key in ("deck/../tasks", "card/a/b/c", "task/" + "f" * 32 + "/x"):
+        response = push(laptop, [{"key": key, "hlc": hlc, "deleted": False, "value": {"name": "Evil"}}])
+        assert response.status_code == 400, f"Expected status code 400 for key {key!r}"
+    assert push(laptop, [{"key": "task/" + "f" * 32, "hlc": "later", "deleted": True}]).status_code == 400
+    assert [task["title"] for task in laptop.get("/tasks").json()] == ["Essay"]
+
+    response = push(laptop, [{"key": "deck/" + "e" * 32, "hlc": hlc, "deleted": False, "value": {"name": "Synced"}}])
+    assert response.json()["applied"] == 1
+    assert "Synced" in [deck["name"] for deck in laptop.get("/decks").json()]
+
+
+def test_push_rejects_invalid_values(installs):
+    """
+    Test that records that do not match their model, and settings that are
+    local to an install, are rejected with the whole batch.
+    """
+    (laptop, _), _ = installs
+    laptop.post("/tasks", json={"title": "Essay", "description": "Draft"})
+    hlc = f"{int(time.time() * 1000) + 60000:015d}:000000:{'f' * 32}"
+    valid = {"key": "task/" + "e" * 32, "hlc": hlc, "deleted": False, "value": {"title": "Synced", "description": ""}}
+
+    invalid = [
+        {"key": "task/" + "f" * 32, "hlc": hlc, "deleted": False, "value": {"foo": 1}},
+        {"key": "task/" + "f" * 32, "hlc": hlc, "deleted": False, "value": {"title": "Bad", "description": "", "status": 3}},
+        {"key": "card/default/" + "f" * 32, "hlc": hlc, "deleted": False, "value": {"x": 1}},
+        {"key": "deck/" + "f" * 32, "hlc": hlc, "deleted": False, "value": {"name": ""}},
+        {"key": "setting/storage_path", "hlc": hlc, "deleted": False, "value": "/elsewhere"},
+        {"key": "setting/storage_path", "hlc": hlc, "deleted": True},
+    ]
+    for change in invalid:
+        response = push(laptop, [valid, change])
+        assert response.status_code == 400, f"Expected status code 400 for {change!r}"
+    assert [task["title"] for task in laptop.get("/tasks?sort_by=title").json()] == ["Essay"]
+    assert laptop.get("/settings").json()["storage_path"] == "storage"
+
+    assert push(laptop, [valid]).json()["applied"] == 1
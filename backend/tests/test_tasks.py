@@ -1,4 +1,5 @@
-from main import app
+import main
+from main import app, load_tasks
 from fastapi.testclient import TestClient
 from pathlib import Path
 from utils import encrypt_data
@@ -39,7 +40,11 @@ def test_add_task():
 
     tasks = client.get("/tasks").json()
     assert len(tasks) == 1, "Expected exactly one task in the list"
-    assert tasks[0] == task, "Added task does not match the input"
+    assert tasks[0]["id"] == 0, "Task id should be its position in the list"
+    assert tasks[0]["title"] == task["title"], "Added task does not match the input"
+    assert tasks[0]["description"] == task["description"], "Added task does not match the input"
+    assert tasks[0]["status"] == "todo", "New tasks should default to 'todo'"
+    assert tasks[0]["due_date"] is None, "New tasks should have no due date by default"
 
 
 def test_add_task_invalid_payload():
@@ -126,3 +131,89 @@ def test_add_and_delete_multiple_tasks():
         assert response.status_code == 200, f"Failed to delete task with ID {i}"
         tasks = client.get("/tasks").json()
         assert len(tasks) == len(tasks_to_add) - (i + 1), "Unexpected number of tasks after deletion"
+
+
+def test_filter_and_sort_tasks():
+    """
+    Test answering filtered and sorted task queries from the secondary indexes.
+    """
+    reset_file(TASKS_FILE, [])
+    tasks_to_add = [
+        {"title": "Essay", "description": "", "due_date": "2024-05-03", "priority": 3, "tags": ["english"]},
+        {"title": "Algebra", "description": "", "due_date": "2024-05-01", "priority": 1, "tags": ["math"]},
+        {"title": "Reading", "description": "", "tags": ["english"]},
+        {"title": "Geometry", "description": "", "due_date": "2024-05-02", "status": "done", "tags": ["math"]},
+    ]
+    for task in tasks_to_add:
+        assert client.post("/tasks", json=task).status_code == 200
+
+    tasks = client.get("/tasks", params={"tag": "math"}).json()
+    assert [task["title"] for task in tasks] == ["Algebra", "Geometry"]
+
+    tasks = client.get("/tasks", params={"status": "todo", "tag": "english"}).json()
+    assert [task["title"] for task in tasks] == ["Essay", "Reading"]
+
+    tasks = client.get("/tasks", params={"due_after": "2024-05-02", "due_before": "2024-05-03"}).json()
+    assert [task["title"] for task in tasks] == ["Essay", "Geometry"]
+
+    tasks = client.get("/tasks", params={"sort_by": "due_date"}).json()
+    assert [task["title"] for task in tasks] == ["Algebra", "Geometry", "Essay", "Reading"]
+
+    tasks = client.get("/tasks", params={"sort_by": "priority", "descending": True}).json()
+    assert tasks[0]["title"] == "Essay" and tasks[-1]["title"] == "Algebra"
+
+    # Updating a task moves it between index entries
+    response = client.put("/tasks/1", json={"title": "Algebra", "description": "", "status": "done", "tags": ["math"]})
+    assert response.status_code == 200
+    tasks = client.get("/tasks", params={"status": "done"}).json()
+    assert [task["title"] for task in tasks] == ["Algebra", "Geometry"]
+    assert client.get("/tasks", params={"due_before": "2024-05-01"}).json() == []
+
+    # Deleting shifts positions and the indexes follow
+    assert client.delete("/tasks/0").status_code == 200
+    tasks = client.get("/tasks", params={"tag": "english"}).json()
+    assert [(task["id"], task["title"]) for task in tasks] == [(1, "Reading")]
+
+    response = client.put("/tasks/10", json={"title": "Missing", "description": ""})
+    assert response.status_code == 404, "Expected status code 404 for updating a non-existent task"
+
+
+def test_writes_leave_loaded_tasks_unchanged():
+    """
+    Test that a write does not modify tasks a concurrent reader already loaded.
+    """
+    reset_file(TASKS_FILE, [{"title": "First", "description": "Kept"}])
+    tasks, index = load_tasks()
+
+    client.post("/tasks", json={"title": "Second", "description": "Added", "status": "done"})
+    client.delete("/tasks/0")
+
+    assert [task["title"] for task in tasks] == ["First"], "A reader's tasks should not change under it"
+    assert index.query(status="todo") == {0} and index.query(status="done") == set()
+    assert [task["title"] for task in client.get("/tasks").json()] == ["Second"]
+
+
+def test_id_migration_keeps_concurrent_writes(monkeypatch):
+    """
+    Test that giving legacy tasks ids does not overwrite a task another worker just added.
+    """
+    legacy = {"title": "Legacy", "description": "Stored without an id"}
+    reset_file(TASKS_FILE, [legacy])
+    load_document = main.load_document
+    replaced = []
+
+    def load_then_replace(path):
+        document = load_document(path)
+        if path == TASKS_FILE and not replaced:
+            # Another worker adds a task right after this one read the file
+            replaced.append(path)
+            reset_file(TASKS_FILE, [legacy, {"uid": "b" * 32, "title": "New", "description": "Added"}])
+        return document
+
+    monkeypatch.setattr(main, "load_document", load_then_replace)
+    client.get("/tasks")
+    monkeypatch.undo()
+
+    tasks = client.get("/tasks").json()
+    assert [task["title"] for task in tasks] == ["Legacy", "New"], "The other worker's task should be kept"
+    assert all(len(task["uid"]) == 32 for task in tasks)
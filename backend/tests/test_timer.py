@@ -1,11 +1,16 @@
-from main import app
+import main
+from main import app, retention_setting
 from fastapi.testclient import TestClient
 from pathlib import Path
 from utils import encrypt_data
+import asyncio
 import json
+import pytest
 
 client = TestClient(app)
 TIMER_FILE = Path("storage/timer.json")
+SETTINGS_FILE = Path("storage/settings.json")
+ARCHIVE_DIR = Path("storage/timer_archive")
 
 
 def reset_file(file_path, content):
@@ -103,3 +108,102 @@ def test_timer_logs():
     logs = response.json()["logs"]
     assert len(logs) == 2, "Expected two log entries after completing two timers"
     assert logs[-1]["duration"] == 20, "Latest log entry duration should match the last timer completed"
+
+
+def test_timer_log_compaction():
+    """
+    Test moving old sessions into daily aggregates and cold archive segments.
+    """
+    old_logs = [
+        {"start_time": "2020-01-05T09:00:00", "end_time": "2020-01-05T09:25:00", "duration": 25},
+        {"start_time": "2020-01-05T10:00:00", "end_time": "2020-01-05T10:25:00", "duration": 20},
+        {"start_time": "2020-02-01T09:00:00", "end_time": "2020-02-01T09:25:00", "duration": 15},
+    ] + [
+        {"start_time": f"2020-03-{day:02d}T08:00:00", "end_time": f"2020-03-{day:02d}T08:25:00", "duration": 25}
+        for day in range(1, 29)
+    ]
+    recent_log = {"start_time": "2099-01-01T09:00:00", "end_time": "2099-01-01T09:25:00", "duration": 30}
+    reset_file(
+        TIMER_FILE,
+        {"status": "idle", "start_time": None, "duration": 0, "logs": old_logs + [recent_log]},
+    )
+    reset_file(SETTINGS_FILE, {"storage_path": "storage", "timer_log_retention_days": 30})
+
+    response = client.post("/timer/compact")
+    assert response.status_code == 200, "Expected status code 200 for compacting timer logs"
+    report = response.json()
+    assert report["sessions_archived"] == len(old_logs), "Expected every old session to be archived"
+    assert report["bytes_reclaimed"] > 0, "Compaction should shrink the timer file"
+
+    status = client.get("/timer/status").json()
+    assert status["logs"] == [recent_log], "Only recent sessions should stay in the timer file"
+
+    segment = ARCHIVE_DIR / "2020-01.seg"
+    assert segment.exists(), "Old sessions should be archived in monthly segments"
+    assert b"2020-01-05" not in segment.read_bytes(), "Segments should be encrypted"
+
+    # Archived sessions stay queryable alongside recent ones
+    history = client.get("/timer/history", params={"start": "2020-01-01", "end": "2020-01-31"}).json()
+    assert history == old_logs[:2]
+    assert len(client.get("/timer/history").json()) == len(old_logs) + 1
+
+    daily = client.get("/timer/daily").json()
+    assert daily["2020-01-05"] == {"sessions": 2, "duration": 45}
+    assert daily["2099-01-01"] == {"sessions": 1, "duration": 30}
+
+    # Running again is a no-op
+    assert client.post("/timer/compact").json()["sessions_archived"] == 0
+
+    # Archive retention prunes segments but keeps their daily totals
+    reset_file(SETTINGS_FILE, {"storage_path": "storage", "timer_archive_retention_days": 365})
+    assert client.post("/timer/compact").json()["segments_pruned"] == 3
+    assert not segment.exists()
+    assert client.get("/timer/history", params={"end": "2020-12-31"}).json() == []
+    assert client.get("/timer/daily").json()["2020-01-05"]["sessions"] == 2
+
+    metrics = client.get("/timer/compaction").json()
+    assert metrics["runs"] >= 3 and metrics["sessions_archived"] >= 3
+
+
+def test_invalid_retention_settings_fall_back_to_defaults():
+    """
+    Test that retention settings that are not positive whole numbers are replaced by their defaults.
+    """
+    reset_file(SETTINGS_FILE, {
+        "storage_path": "storage",
+        "timer_log_retention_days": "30",
+        "timer_archive_retention_days": 0,
+        "timer_compaction_interval_minutes": -5,
+    })
+    assert retention_setting("timer_log_retention_days") == 30
+    assert retention_setting("timer_archive_retention_days") is None
+    assert retention_setting("timer_compaction_interval_minutes") == 60
+    assert client.post("/timer/compact").status_code == 200
+
+    reset_file(SETTINGS_FILE, {"storage_path": "storage", "timer_log_retention_days": None, "timer_archive_retention_days": 90})
+    assert retention_setting("timer_log_retention_days") == 30, "Only archive retention may be None"
+    assert retention_setting("timer_archive_retention_days") == 90
+
+
+def test_compactor_keeps_running_after_failures(monkeypatch):
+    """
+    Test that the background compactor logs failures and waits before trying again.
+    """
+    sleeps = []
+
+    async def record_sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 4:
+            raise asyncio.CancelledError
+
+    def fail():
+        raise OSError("Disk full")
+
+    monkeypatch.setattr(main.asyncio, "sleep", record_sleep)
+    monkeypatch.setattr(main, "compact_timer_logs", fail)
+    reset_file(SETTINGS_FILE, {"storage_path": "storage", "timer_compaction_interval_minutes": "soon"})
+    (ARCHIVE_DIR / "compaction.metrics").unlink(missing_ok=True)
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(main.run_compactor())
+    assert sleeps == [3600, 3600, 3600, 3600], "Each attempt and each retry should wait the default interval"
@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+from tests.helpers import backend_server
+import httpx
+import pytest
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """
+    Starts the backend with several worker processes sharing one fresh
+    storage directory, as it would run in a multi-worker deployment.
+    """
+    with backend_server(tmp_path, "--workers", "3") as url, httpx.Client(base_url=url, timeout=30) as client:
+        yield client
+
+
+def test_concurrent_writes_across_workers(workers):
+    """
+    Test that concurrent writers served by different workers do not lose
+    updates and that every worker reads the latest data afterwards.
+    """
+    def add_task(number):
+        response = workers.post("/tasks", json={"title": f"Task {number}", "description": "Parallel"})
+        assert response.status_code == 200
+
+    def add_progress(number):
+        response = workers.post("/progress", json={"study_time": 5, "tasks_completed": 1})
+        assert response.status_code == 200
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(add_task, range(40)))
+        list(pool.map(add_progress, range(40)))
+
+    # Requests land on arbitrary workers, so repeat the reads to reach each of them
+    for _ in range(10):
+        tasks = workers.get("/tasks").json()
+        assert len(tasks) == 40, "No task should be lost to a concurrent write"
+        assert len({task["uid"] for task in tasks}) == 40
+        assert workers.get("/progress").json() == {"study_time": 200, "tasks_completed": 40}
+
+    workers.put("/tasks/0", json={"title": "Task 0", "description": "Parallel", "status": "done"})
+    for _ in range(10):
+        assert workers.get("/tasks").json()[0]["status"] == "done", "Every worker should see the update"
@@ -0,0 +1,108 @@
+import json
+import zlib
+from datetime import date, datetime
+from pathlib import Path
+from store import read_json
+from utils import encrypt_bytes, decrypt_bytes
+
+# Compaction totals before the first run; later totals are stored on disk
+EMPTY_METRICS = {
+    "runs": 0,
+    "last_run": None,
+    "sessions_archived": 0,
+    "segments_pruned": 0,
+    "bytes_reclaimed": 0,
+}
+
+
+def load_metrics(path: Path) -> dict:
+    return dict(read_json(path)) if path.exists() else dict(EMPTY_METRICS)
+
+
+def segment_path(archive_dir: Path, month: str) -> Path:
+    return archive_dir / f"{month}.seg"
+
+
+def read_segment(path: Path) -> list[dict]:
+    try:
+        encrypted = path.read_bytes()
+    except FileNotFoundError:
+        return []  # Never written, or pruned since the archive was listed
+    return json.loads(zlib.decompress(decrypt_bytes(encrypted)))
+
+
+def write_segment(path: Path, sessions: list[dict]):
+    temp_path = path.with_name(path.name + ".tmp")
+    temp_path.write_bytes(encrypt_bytes(zlib.compress(json.dumps(sessions).encode(), 9)))
+    temp_path.replace(path)
+
+
+def archive_sessions(archive_dir: Path, sessions: list[dict]):
+    """
+    Appends sessions to the cold segment of the month they ended in. Sessions
+    already in a segment are skipped, so rerunning an interrupted compaction
+    does not archive anything twice.
+    """
+    archive_dir.mkdir(exist_ok=True)
+    by_month: dict[str, list[dict]] = {}
+    for session in sessions:
+        by_month.setdefault(session["end_time"][:7], []).append(session)
+    for month, new_sessions in by_month.items():
+        path = segment_path(archive_dir, month)
+        archived = read_segment(path)
+        seen = {(session["start_time"], session["end_time"]) for session in archived}
+        archived.extend(
+            session for session in new_sessions if (session["start_time"], session["end_time"]) not in seen
+        )
+        archived.sort(key=lambda session: session["end_time"])
+        write_segment(path, archived)
+
+
+def read_archive(archive_dir: Path, start: date | None = None, end: date | None = None) -> list[dict]:
+    """
+    Returns archived sessions that ended between `start` and `end` (inclusive),
+    opening only the monthly segments that overlap the range.
+    """
+    sessions = []
+    for path in sorted(archive_dir.glob("*.seg")):
+        month = path.stem
+        if start is not None and month < start.isoformat()[:7]:
+            continue
+        if end is not None and month > end.isoformat()[:7]:
+            continue
+        sessions.extend(session for session in read_segment(path) if in_range(session, start, end))
+    return sessions
+
+
+def day_in_range(day: str, start: date | None, end: date | None) -> bool:
+    return (start is None or day >= start.isoformat()) and (end is None or day <= end.isoformat())
+
+
+def in_range(session: dict, start: date | None, end: date | None) -> bool:
+    return day_in_range(session["end_time"][:10], start, end)
+
+
+def add_to_daily(daily: dict, sessions: list[dict]):
+    for session in sessions:
+        totals = daily.setdefault(session["end_time"][:10], {"sessions": 0, "duration": 0})
+        totals["sessions"] += 1
+        totals["duration"] += session["duration"]
+
+
+def prune_segments(archive_dir: Path, cutoff: datetime) -> tuple[int, int]:
+    """
+    Deletes segments whose whole month ended before `cutoff` and returns how
+    many were deleted and their size in bytes. Their sessions remain counted
+    in the daily aggregates.
+    """
+    pruned = 0
+    size = 0
+    for path in archive_dir.glob("*.seg"):
+        if path.stem < cutoff.isoformat()[:7]:
+            try:
+                size += path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            pruned += 1
+    return pruned, size
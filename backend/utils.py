@@ -1,3 +1,5 @@
+import os
+import time
 from pathlib import Path
 from cryptography.fernet import Fernet
 
@@ -8,17 +10,32 @@ ENCRYPTION_KEY_FILE = STORAGE_DIR / "encryption_key"
 # Ensure the storage directory exists
 STORAGE_DIR.mkdir(exist_ok=True)
 
-# Load or create the encryption key
-if not ENCRYPTION_KEY_FILE.exists():
+def load_or_create_key() -> bytes:
+    try:
+        # O_EXCL lets exactly one worker create the key when several start together
+        fd = os.open(ENCRYPTION_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+    except FileExistsError:
+        key = ENCRYPTION_KEY_FILE.read_bytes()
+        while len(key) < 44:  # The creating worker has not finished writing it
+            time.sleep(0.01)
+            key = ENCRYPTION_KEY_FILE.read_bytes()
+        return key
     key = Fernet.generate_key()
-    ENCRYPTION_KEY_FILE.write_bytes(key)
-else:
-    key = ENCRYPTION_KEY_FILE.read_bytes()
+    with os.fdopen(fd, "wb") as key_file:
+        key_file.write(key)
+    return key
 
-cipher = Fernet(key)
+# Load or create the encryption key
+cipher = Fernet(load_or_create_key())
 
 def encrypt_data(data: str) -> str:
     return cipher.encrypt(data.encode()).decode()
 
 def decrypt_data(data: str) -> str:
     return cipher.decrypt(data.encode()).decode()
+
+def encrypt_bytes(data: bytes) -> bytes:
+    return cipher.encrypt(data)
+
+def decrypt_bytes(data: bytes) -> bytes:
+    return cipher.decrypt(data)